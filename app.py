@@ -1,95 +1,235 @@
-from flask import Flask, request
+import os
+import time
+# Startup phases are timed from here, see create_app()
+importStarted = time.perf_counter()
+
+import config
+from flask import Flask, g, request, Response
+from modules.classes.Compression import compressResponse
 from modules.classes.FlaskAPI import FlaskAPI
+from modules.classes.JSONProvider import createJSONProvider
+from modules.classes.Metrics import metrics
 
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+from modules.security.RateLimits import rateLimitKey
+from modules.security.RateLimits import routeLimit
+# Registers the sharedmem:// limiter storage
+from modules.security import SharedMemoryStorage
 
 from flask_cors import CORS
 
 app = Flask(__name__)
+app.json = createJSONProvider(app)
 CORS(app)
 app.config.from_object('config')
-limiter = Limiter(get_remote_address, app=app, default_limits=["86400 per day", "3600 per hour"], storage_uri='memory://')
+limiter = Limiter(rateLimitKey, app=app, default_limits=["86400 per day", "3600 per hour"], storage_uri=app.config['RATELIMIT_STORAGE_URI'])
+# Built by create_app()
+api = None
+
+
+def create_app(warm_up: bool = None) -> Flask:
+    """
+    Application factory for WSGI servers, ex: gunicorn 'app:create_app()', see gunicorn.conf.py
+    Building the FlaskAPI opens no database connection, each process opens its own on first use (see ConnectionPool.open()),
+    so the app can be preloaded in a master process and forked into workers
+
+    :param warm_up: Warm the process up now (see warm()), defaults to config.WARM_UP.
+                    A preloading master passes False and each worker is warmed up after the fork instead
+    :return: Flask app
+    """
+
+    global api
+    if api is None:
+        api = FlaskAPI()
+        # Lets the rate limiter tell verified API keys apart, see RateLimits.apiKeyDigest()
+        app.extensions["flaskapi"] = api
+    metrics.startup["app"] = time.perf_counter() - importStarted
+    if config.WARM_UP if warm_up is None else warm_up:
+        warm()
+    return app
+
+
+def warm():
+    """
+    Open the connections, load the schema cache and prepare common statements of this process, see FlaskAPI.warmUp()
+    """
+
+    api.warmUp()
+    metrics.startup["ready"] = time.perf_counter() - importStarted
+    app.logger.info(f"Worker {os.getpid()} ready {metrics.startup['ready']:.3f}s after import")
+
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+    if "first_request" not in metrics.startup:
+        metrics.startup["first_request"] = g.start - importStarted
+        app.logger.info(f"Worker {os.getpid()} first request {metrics.startup['first_request']:.3f}s after import")
+
+
+@app.after_request
+def record_latency(response):
+    if 'start' not in g:
+        return response
+    latency = metrics.endpoint(request.endpoint).latency
+    start = g.start
+    if response.is_streamed:
+        # after_request runs before a streamed body is generated, it is timed until the server closes it (sent or client gone)
+        response.call_on_close(lambda: latency.observe(time.perf_counter() - start))
+    else:
+        latency.observe(time.perf_counter() - start)
+    return response
+
+
+@app.after_request
+def compress(response):
+    return compressResponse(response, request.accept_encodings)
+
+
+@app.route('/metrics', methods=['GET'])
+@limiter.limit(routeLimit('get_metrics'))
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/api/v1/tables', methods=['GET'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('get_tables'))
 def get_tables():
     return api.get_tables(api_key=request.headers.get('x-api-key'))
 
 
 @app.route('/api/v1/create-table', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('create_table'))
 def create_table():
     return api.create_table(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
 @app.route('/api/v1/delete-table', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('delete_table'))
 def delete_table():
     return api.delete_table(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
 @app.route('/api/v1/columns', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('get_columns'))
 def get_columns():
     return api.get_columns(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
 @app.route('/api/v1/create-column', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('create_column'))
 def create_column():
     return api.create_column(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
 @app.route('/api/v1/delete-column', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('delete_column'))
 def delete_column():
     return api.delete_column(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
 @app.route('/api/v1/update-column-name', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('update_column_name'))
 def update_column_name():
     return api.update_column_name(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
 @app.route('/api/v1/update-column-type', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('update_column_type'))
 def update_column_type():
     return api.update_column_type(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
+@app.route('/api/v1/create-index', methods=['GET', 'POST'])
+@limiter.limit(routeLimit('create_index'))
+def create_index():
+    return api.create_index(api_key=request.headers.get('x-api-key'), data=request.get_json())
+
+
+@app.route('/api/v1/delete-index', methods=['GET', 'POST'])
+@limiter.limit(routeLimit('delete_index'))
+def delete_index():
+    return api.delete_index(api_key=request.headers.get('x-api-key'), data=request.get_json())
+
+
 @app.route('/api/v1/rows', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('get_rows'))
 def get_rows():
     return api.get_rows(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
 @app.route('/api/v1/insert-row', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('insert_row'))
 def insert_row():
     return api.insert_row(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
+@app.route('/api/v1/insert-rows', methods=['GET', 'POST'])
+@limiter.limit(routeLimit('insert_rows'))
+def insert_rows():
+    return api.insert_rows(api_key=request.headers.get('x-api-key'), data=request.get_json())
+
+
+@app.route('/api/v1/import', methods=['POST'])
+@limiter.limit(routeLimit('import_rows'))
+def import_rows():
+    return api.import_rows(api_key=request.headers.get('x-api-key'), data=request.args.to_dict(), stream=request.stream)
+
+
 @app.route('/api/v1/select-row', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('select_row'))
 def select_row():
     return api.select_row(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
+@app.route('/api/v1/aggregate', methods=['GET', 'POST'])
+@limiter.limit(routeLimit('aggregate'))
+def aggregate():
+    return api.aggregate(api_key=request.headers.get('x-api-key'), data=request.get_json())
+
+
 @app.route('/api/v1/update-row', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('update_row'))
 def update_row():
     return api.update_row(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
 @app.route('/api/v1/delete-row', methods=['GET', 'POST'])
-@limiter.limit("1/second")
+@limiter.limit(routeLimit('delete_row'))
 def delete_row():
     return api.delete_row(api_key=request.headers.get('x-api-key'), data=request.get_json())
 
 
+@app.route('/api/v1/update-rows', methods=['GET', 'POST'])
+@limiter.limit(routeLimit('update_rows'))
+def update_rows():
+    return api.update_rows(api_key=request.headers.get('x-api-key'), data=request.get_json())
+
+
+@app.route('/api/v1/delete-rows', methods=['GET', 'POST'])
+@limiter.limit(routeLimit('delete_rows'))
+def delete_rows():
+    return api.delete_rows(api_key=request.headers.get('x-api-key'), data=request.get_json())
+
+
+@app.route('/api/v1/batch', methods=['POST'])
+@limiter.limit(routeLimit('batch'))
+def batch():
+    return api.batch(api_key=request.headers.get('x-api-key'), data=request.get_json())
+
+
+@app.route('/api/v1/export', methods=['GET', 'POST'])
+@limiter.limit(routeLimit('export'))
+def export():
+    return api.export(api_key=request.headers.get('x-api-key'), data=request.get_json())
+
+
+@app.route('/api/v1/slow-queries', methods=['GET', 'POST'])
+@limiter.limit(routeLimit('slow_queries'))
+def slow_queries():
+    return api.slow_queries(api_key=request.headers.get('x-api-key'), data=request.get_json(silent=True))
+
+
 if __name__ == '__main__':
-    api = FlaskAPI()
-    app.run()
+    create_app()
+    app.run(threaded=True)
@@ -1,3 +1,106 @@
+import os
+import json
+import multiprocessing
+
 DEBUG = True
 host = '127.0.0.1'
 port = 5000
+
+# Worker processes under gunicorn, see gunicorn.conf.py
+WORKERS = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+# max_connections of the Postgres server (and of each replica), and the connections left to other clients (psql, migrations)
+POSTGRES_MAX_CONNECTIONS = int(os.environ.get("POSTGRES_MAX_CONNECTIONS", 100))
+POSTGRES_RESERVED_CONNECTIONS = int(os.environ.get("POSTGRES_RESERVED_CONNECTIONS", 10))
+
+# Database connection pool, one per worker process, by default each worker's share of the server's connections
+POOL_MIN_CONNECTIONS = int(os.environ.get("POSTGRES_POOL_MIN", 1))
+POOL_MAX_CONNECTIONS = int(os.environ.get("POSTGRES_POOL_MAX", max(1, (POSTGRES_MAX_CONNECTIONS - POSTGRES_RESERVED_CONNECTIONS) // WORKERS)))
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("POSTGRES_POOL_TIMEOUT", 30))
+POOL_PING_AFTER = float(os.environ.get("POSTGRES_POOL_PING_AFTER", 30))
+# Open the connections, load the schema cache and prepare common statements before a worker takes traffic
+WARM_UP = os.environ.get("WARM_UP", "true").lower() == "true"
+
+# Read replicas, a JSON list of libpq connection strings ("host=replica1 dbname=db user=user password=password")
+# get_tables, get_columns, get_rows, select_row, aggregate and export are spread over them, everything else goes to the primary
+REPLICA_DSNS = json.loads(os.environ.get("POSTGRES_REPLICAS", "[]"))
+# Seconds of replication lag after which a replica is skipped, checked at most every REPLICA_CHECK_INTERVAL seconds
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL", 1))
+# Seconds a client reads from the primary after one of its writes
+READ_YOUR_WRITES_WINDOW = float(os.environ.get("READ_YOUR_WRITES_WINDOW", 5))
+# Where recent writes are recorded, the memory-mapped file is shared by every worker process on the host
+READ_YOUR_WRITES_STORAGE_URI = os.environ.get("READ_YOUR_WRITES_STORAGE_URI", "sharedmem:///tmp/flaskapi-replicas")
+
+# API keys
+API_KEY_STORE = os.environ.get("API_KEY_STORE", "env")
+API_KEY_FILE = os.environ.get("API_KEY_FILE", "api_keys.txt")
+API_KEY_CACHE_SIZE = int(os.environ.get("API_KEY_CACHE_SIZE", 1024))
+API_KEY_CACHE_TTL = float(os.environ.get("API_KEY_CACHE_TTL", 60))
+# Invalid keys are remembered apart from the valid ones, briefly
+API_KEY_REJECTED_CACHE_SIZE = int(os.environ.get("API_KEY_REJECTED_CACHE_SIZE", 1024))
+API_KEY_REJECTED_CACHE_TTL = float(os.environ.get("API_KEY_REJECTED_CACHE_TTL", 5))
+
+# Schema cache, seconds before table/column metadata is reloaded to pick up changes made outside the API
+SCHEMA_CACHE_TTL = float(os.environ.get("SCHEMA_CACHE_TTL", 60))
+
+# Rows fetched per round trip when get_rows streams its response
+STREAM_FETCH_SIZE = int(os.environ.get("STREAM_FETCH_SIZE", 2000))
+
+# Page size of get_rows/select_row when a client passes "after" without "limit"
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", 100))
+
+# Rows per multi-row INSERT statement sent by insert_rows
+BULK_INSERT_PAGE_SIZE = int(os.environ.get("BULK_INSERT_PAGE_SIZE", 1000))
+
+# Tables estimated to hold fewer rows are counted exactly when an aggregate asks for an approximate count
+APPROXIMATE_COUNT_MIN_ROWS = int(os.environ.get("APPROXIMATE_COUNT_MIN_ROWS", 100000))
+
+# /api/v1/export streams chunks of EXPORT_CHUNK_SIZE bytes through a queue of EXPORT_QUEUE_SIZE chunks,
+# Arrow and Parquet record batches are parsed from EXPORT_BATCH_BYTES of CSV
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 65536))
+EXPORT_QUEUE_SIZE = int(os.environ.get("EXPORT_QUEUE_SIZE", 16))
+EXPORT_BATCH_BYTES = int(os.environ.get("EXPORT_BATCH_BYTES", 1024 * 1024))
+
+# Statements slower than SLOW_QUERY_THRESHOLD seconds (0 turns the log off) are kept in a ring buffer of SLOW_QUERY_LOG_SIZE,
+# a SLOW_QUERY_EXPLAIN_SAMPLE fraction of slow SELECTs is explained, at most one every SLOW_QUERY_EXPLAIN_INTERVAL seconds
+SLOW_QUERY_THRESHOLD = float(os.environ.get("SLOW_QUERY_THRESHOLD", 1))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", 200))
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.environ.get("SLOW_QUERY_EXPLAIN_SAMPLE", 0.1))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", 10))
+# Sequential scans reading this many rows are flagged as large
+SLOW_QUERY_SEQ_SCAN_ROWS = int(os.environ.get("SLOW_QUERY_SEQ_SCAN_ROWS", 10000))
+
+# Operations accepted in one /api/v1/batch request
+BATCH_MAX_OPERATIONS = int(os.environ.get("BATCH_MAX_OPERATIONS", 1000))
+
+# Bytes of an /api/v1/import upload read and sent to COPY at a time
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 65536))
+
+# Row operations run as prepared statements, cached per connection
+PREPARED_STATEMENTS = os.environ.get("PREPARED_STATEMENTS", "true").lower() == "true"
+PREPARED_STATEMENT_CACHE_SIZE = int(os.environ.get("PREPARED_STATEMENT_CACHE_SIZE", 100))
+
+# get_rows and select_row rows are serialised by Postgres and passed through undecoded
+DATABASE_JSON = os.environ.get("DATABASE_JSON", "true").lower() == "true"
+# JSON encoder of the other responses: auto (orjson when installed), orjson or json
+JSON_PROVIDER = os.environ.get("JSON_PROVIDER", "auto")
+
+# Response compression negotiated on Accept-Encoding, brotli is offered when installed
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 4))
+
+# Read response cache, bounded by the size of the cached bodies, one per worker process (256 MiB split between the workers by default)
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024 // WORKERS))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 60))
+# Where the table versions are kept, the memory-mapped file is shared by every worker process on the host
+RESPONSE_CACHE_STORAGE_URI = os.environ.get("RESPONSE_CACHE_STORAGE_URI", "sharedmem:///tmp/flaskapi-versions")
+
+# Rate limits, counters are shared by every worker process on the host through a memory-mapped file
+RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "true").lower() == "true"
+RATELIMIT_STORAGE_URI = os.environ.get("RATELIMIT_STORAGE_URI", "sharedmem:///tmp/flaskapi-ratelimit")
+# {"route function name" or "default": "limit"}
+RATE_LIMITS = json.loads(os.environ.get("RATE_LIMITS", '{"default": "1/second"}'))
+# {"sha256 of the api key": {"route function name" or "default": "limit"}}
+API_KEY_RATE_LIMITS = json.loads(os.environ.get("API_KEY_RATE_LIMITS", "{}"))
@@ -0,0 +1,30 @@
+import os
+
+import config
+
+# gunicorn -c gunicorn.conf.py
+# The app is imported once in the master and forked into the workers, create_app() opens no database connection
+# and each worker opens and warms up its own pool in post_worker_init before it accepts requests
+wsgi_app = "app:create_app(warm_up=False)"
+preload_app = True
+bind = os.environ.get("GUNICORN_BIND", f"{config.host}:{config.port}")
+# Requests mostly wait on Postgres, threads overlap that wait and one worker per core is enough.
+# Every worker opens its own pool and cache, the pool defaults to its share of POSTGRES_MAX_CONNECTIONS (see config.py)
+workers = config.WORKERS
+worker_class = "gthread"
+# One pooled connection per thread, a request never waits on the pool of its own worker
+threads = int(os.environ.get("GUNICORN_THREADS", config.POOL_MAX_CONNECTIONS))
+
+
+def post_worker_init(worker):
+    """
+    :param worker: gunicorn worker, forked and with the app loaded
+    """
+
+    if config.WARM_UP:
+        import app
+        # A worker that can't warm up (ex: Postgres not up yet) still boots, it opens what it needs on its first requests
+        try:
+            app.warm()
+        except Exception:
+            worker.log.exception(f"Worker {os.getpid()} warm-up failed, starting cold")
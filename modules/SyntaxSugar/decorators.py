@@ -1,4 +1,13 @@
+import time
+import psycopg2
 from typing import Callable
+from flask import has_request_context
+from flask import json
+from flask import request
+from flask import Response
+from psycopg2.pool import PoolError
+from modules.classes.Metrics import metrics
+from modules.classes.ResponseCache import CachedResponse
 
 
 def convertTableNameToLower(func: Callable) -> Callable:
@@ -54,3 +63,164 @@ def convertColumnNameToLower(func: Callable) -> Callable:
         return func(*args, **kwargs)
 
     return wrapper
+
+
+def useConnection(func: Callable) -> Callable:
+    """
+    Checkout a pooled connection and a fresh cursor for the duration of the call, from the pool chosen by FlaskAPI.poolFor()
+    Nested calls (ex: get_rows -> get_columns) reuse the connection already checked out by the thread
+    A replica whose connection can't be checked out or breaks is skipped until its next lag check
+    Records the function latency, pool wait, database time and rows in metrics (see Metrics.py)
+
+    :param func: function
+    """
+
+    def wrapper(self, *args, **kwargs):
+        """
+        :param self: FlaskAPI
+        :param args: tuple
+        :param kwargs: dict
+        :return: dict
+        """
+        if getattr(self.local, 'conn', None) is not None:
+            return func(self, *args, **kwargs)
+
+        operation = metrics.function(func.__name__)
+        start = time.perf_counter()
+        pool = self.poolFor(func.__name__)
+        # Read by @cachedResponse, see there
+        self.local.replicaRead = pool is not self.pool
+        try:
+            with pool.connection() as conn:
+                operation.pool_wait.observe(time.perf_counter() - start)
+                metrics.current = operation
+                self.local.conn = conn
+                self.local.cur = cur = conn.cursor()
+                self.local.pool = pool
+                try:
+                    return func(self, *args, **kwargs)
+                finally:
+                    cur.close()
+                    self.local.conn = None
+                    self.local.cur = None
+                    self.local.pool = None
+                    metrics.current = None
+                    operation.execute.observe(cur.execute_time)
+                    operation.fetch.observe(cur.fetch_time)
+                    operation.rows.observe(cur.rows)
+                    operation.latency.observe(time.perf_counter() - start)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError):
+            if pool is not self.pool:
+                self.replicas.failed(pool)
+            raise
+
+    return wrapper
+
+
+def cachedResponse(func: Callable) -> Callable:
+    """
+    Serve a read function from FlaskAPI.responseCache, keyed by function and request data and checked against the table version
+    Responses carry a strong ETag, a poll sending it back in If-None-Match gets a 304 without touching the database
+    Must sit above @useConnection so a cache hit doesn't checkout a connection
+    Concurrent identical misses are coalesced, one of them reads and the others share its body (see ResponseCache.join).
+    Clients reading their own writes skip the cached bodies and only share reads with each other,
+    they never get a body that may come from a replica
+    A response read from a replica is not cached while its table may not have replicated the last write yet
+    Streams, errors and calls made outside a request are not cached
+
+    :param func: function
+    """
+
+    def wrapper(self, *args, **kwargs):
+        """
+        :param self: FlaskAPI
+        :param args: tuple
+        :param kwargs: dict
+        :return: Response
+        """
+        data = kwargs.get('data') or {}
+        if not has_request_context() or data.get('stream'):
+            return func(self, *args, **kwargs)
+
+        table_name = str(data.get('table_name', '*')).lower()
+        key = (func, json.dumps(data, sort_keys=True, default=str))
+        version = self.responseCache.version(table_name)
+        # A client that just wrote reads the primary, never a body cached before its write reached this worker
+        readsOwnWrites = self.readsOwnWrites()
+        entry = None if readsOwnWrites else self.responseCache.get(key, version)
+        if entry is None:
+            # Flights are keyed on the pool choice too, see FlaskAPI.poolFor()
+            flightKey = (key, readsOwnWrites)
+            flight, leader = self.responseCache.join(flightKey, version, table_name)
+            if not leader:
+                entry = flight.wait()
+            if entry is None:
+                try:
+                    result, entry = readResponse(self, func, args, kwargs, table_name, key, version)
+                finally:
+                    if leader:
+                        self.responseCache.land(flightKey, version, flight, entry)
+                if entry is None:
+                    return result
+
+        response = Response(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+        return response.make_conditional(request)
+
+    return wrapper
+
+
+def readResponse(self, func: Callable, args: tuple, kwargs: dict, table_name: str, key: tuple, version: int) -> tuple:
+    """
+    Run a read function for @cachedResponse and serialise its result once
+
+    :param self: FlaskAPI
+    :param func: function
+    :param table_name: Table read
+    :param key: Cache key
+    :param version: Version of the table when the request arrived
+    :return: (result, None) when the result can't be cached (error, stream), (None, CachedResponse) otherwise
+    """
+
+    self.local.replicaRead = False
+    result = func(self, *args, **kwargs)
+    if isinstance(result, Response):
+        if result.status_code != 200 or result.is_streamed:
+            return result, None
+        body = result.get_data()
+    elif isinstance(result, dict) and 'error' in result:
+        return result, None
+    else:
+        serialiseStart = time.perf_counter()
+        body = json.dumps(result).encode()
+        metrics.endpoint(request.endpoint).serialise.observe(time.perf_counter() - serialiseStart)
+
+    # Shared with the requests waiting on the read but not cached: the table was written while it ran,
+    # or it came from a replica that may not have the last write yet
+    if (self.responseCache.version(table_name) != version
+            or (self.local.replicaRead and (self.replicas.recentlyWritten(table_name) or self.replicas.recentlyWritten("*")))):
+        return None, CachedResponse(body, version, time.monotonic())
+    return None, self.responseCache.set(key, version, body)
+
+
+def countError(func: Callable) -> Callable:
+    """
+    Count an ErrorHandling error in metrics against the FlaskAPI function running on the thread
+
+    :param func: function
+    """
+
+    name = func.__name__
+
+    def wrapper(*args, **kwargs):
+        """
+        :param args: tuple
+        :param kwargs: dict
+        :return: dict
+        """
+        metrics.error(name)
+        return func(*args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = func.__doc__
+    return wrapper
@@ -0,0 +1,98 @@
+import zlib
+import config
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+compressibleTypes = ("application/json", "application/x-ndjson", "text/")
+
+
+def chooseEncoding(accept_encodings) -> str:
+    """
+    Content negotiation on Accept-Encoding, br is preferred to gzip at equal quality and only offered when brotli is installed
+
+    :param accept_encodings: request.accept_encodings
+    :return: "br", "gzip" or None for identity
+    """
+
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, bestQuality = None, 0
+    for encoding in candidates:
+        quality = accept_encodings.quality(encoding)
+        if quality > bestQuality:
+            best, bestQuality = encoding, quality
+    return best
+
+
+def compressor(encoding: str):
+    """
+    :param encoding: "br" or "gzip"
+    :return: (compress(bytes) -> bytes, finish() -> bytes) of an incremental compressor
+    """
+
+    if encoding == "br":
+        stream = brotli.Compressor(quality=config.BROTLI_QUALITY)
+        return stream.process, stream.finish
+    # wbits 31: zlib stream with a gzip header and trailer
+    stream = zlib.compressobj(config.COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+    return stream.compress, stream.flush
+
+
+def compressChunks(chunks, encoding: str):
+    """
+    Compress a streamed body chunk by chunk, the compressor only emits output once it has buffered enough input,
+    so per-row chunks still compress well and the body is never held whole
+
+    :param chunks: Iterable of bytes
+    :param encoding: "br" or "gzip"
+    """
+
+    compress, finish = compressor(encoding)
+    for chunk in chunks:
+        compressed = compress(chunk)
+        if compressed:
+            yield compressed
+    yield finish()
+
+
+def compressResponse(response: Response, accept_encodings) -> Response:
+    """
+    Compress a response with the encoding the client accepts best, called from app.after_request
+
+    Bodies smaller than config.COMPRESSION_MIN_SIZE are sent as is, streamed bodies are always compressed, incrementally.
+    The ETag is made weak, the compressed bytes differ from the ones it was computed on,
+    If-None-Match compares ETags weakly so conditional requests keep getting 304s
+
+    :param response: Response of the request
+    :param accept_encodings: request.accept_encodings
+    :return: Response
+    """
+
+    if (not config.COMPRESSION_ENABLED or response.status_code != 200 or response.direct_passthrough
+            or "Content-Encoding" in response.headers or not (response.mimetype or "").startswith(compressibleTypes)):
+        return response
+    response.vary.add("Accept-Encoding")
+
+    encoding = chooseEncoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compressChunks(response.iter_encoded(), encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < config.COMPRESSION_MIN_SIZE:
+            return response
+        compress, finish = compressor(encoding)
+        response.set_data(compress(body) + finish())
+
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
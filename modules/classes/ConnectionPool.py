@@ -0,0 +1,203 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PreparedStatementConnection(extensions.connection):
+    """
+    Connection remembering the statements it has prepared, a PREPARE lasts as long as the database session
+    The least recently used statements are deallocated once there are more than maxsize
+
+    prepare: Name of the prepared statement for key, preparing query on first use
+    deallocate: Drop the statement prepared for key
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PreparedStatementConnection, self).__init__(*args, **kwargs)
+        self.preparedStatements = OrderedDict()
+        self.preparedCount = 0
+
+    def prepare(self, cur, key, query: str, maxsize: int) -> str:
+        """
+        :param cur: Cursor of this connection
+        :param key: Cache key of the statement
+        :param query: Query text with $1, $2 ... parameters
+        :param maxsize: Statements kept prepared on this connection
+        :return: Statement name to EXECUTE
+        """
+
+        name = self.preparedStatements.get(key)
+        if name is not None:
+            self.preparedStatements.move_to_end(key)
+            return name
+
+        self.preparedCount += 1
+        name = f"flaskapi_{self.preparedCount}"
+        cur.execute(f"PREPARE {name} AS {query}")
+        self.preparedStatements[key] = name
+        while len(self.preparedStatements) > maxsize:
+            _, evicted = self.preparedStatements.popitem(last=False)
+            cur.execute(f"DEALLOCATE {evicted}")
+        return name
+
+    def deallocate(self, cur, key) -> None:
+        """
+        :param cur: Cursor of this connection, outside of a failed transaction
+        :param key: Cache key of the statement
+        """
+
+        name = self.preparedStatements.pop(key, None)
+        if name is not None:
+            cur.execute(f"DEALLOCATE {name}")
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of database connections shared by every request
+    Each request checks out its own connection so concurrent requests never share a cursor or transaction
+    Nothing is opened until the first checkout of the process, a pool built in a gunicorn --preload master
+    opens its connections in each worker after the fork instead of sharing the master's sockets
+
+    getconn: Checkout a healthy connection, waiting up to timeout seconds when every connection is in use
+    putconn: Return a connection to the pool, closing it if it is broken
+    connection: Context manager around getconn/putconn
+    healthy: Check a connection is still usable, pinging it if it has been idle for a while
+    open: Open the minconn connections of this process, done by the first checkout or a warm-up
+    closeall: Close every idle connection
+
+    :param minconn: Connections opened by the first checkout of a process
+    :param maxconn: Upper bound of connections open at the same time
+    :param timeout: Seconds to wait for a free connection before raising PoolError
+    :param ping_after: Seconds a connection may sit idle before it is pinged on checkout
+    :param kwargs: psycopg2.connect arguments
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float = 30, ping_after: float = 30, **kwargs):
+        self.kwargs = kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.pid = None
+        self.openLock = threading.Lock()
+        self.lock = threading.Lock()
+        self.available = threading.BoundedSemaphore(maxconn)
+        self.idle = []
+        # Connections of the parent process, kept referenced: closing them (or letting them be collected)
+        # would end the parent's sessions on the sockets the fork shares
+        self.inherited = []
+
+    def open(self) -> None:
+        """
+        Start the pool in this process, once per process: connections inherited through a fork are set aside
+        and minconn connections of its own are opened
+        """
+
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        with self.openLock:
+            if self.pid == pid:
+                return
+            if self.pid is not None:
+                self.inherited.extend(conn for conn, _ in self.idle)
+                self.lock = threading.Lock()
+                self.available = threading.BoundedSemaphore(self.maxconn)
+            self.idle = [(self.connect(), time.monotonic()) for _ in range(self.minconn)]
+            self.pid = pid
+
+    def connect(self) -> extensions.connection:
+        return psycopg2.connect(connection_factory=PreparedStatementConnection, **self.kwargs)
+
+    def healthy(self, conn: extensions.connection, lastUsed: float) -> bool:
+        """
+        A connection dropped by the server is only noticed on the next query,
+        so connections idle for longer than ping_after are checked with SELECT 1
+
+        :param conn: Idle connection
+        :param lastUsed: time.monotonic() of when the connection was returned
+        :return: True if the connection can be handed out
+        """
+
+        if conn.closed:
+            return False
+        if time.monotonic() - lastUsed < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def discard(self, conn: extensions.connection) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self) -> extensions.connection:
+        self.open()
+        if not self.available.acquire(timeout=self.timeout):
+            raise PoolError("connection pool exhausted")
+        try:
+            while True:
+                with self.lock:
+                    conn, lastUsed = self.idle.pop() if self.idle else (None, None)
+                if conn is None:
+                    return self.connect()
+                if self.healthy(conn, lastUsed):
+                    return conn
+                self.discard(conn)
+        except Exception:
+            self.available.release()
+            raise
+
+    def putconn(self, conn: extensions.connection, close: bool = False) -> None:
+        try:
+            if not close and not conn.closed:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+        except psycopg2.Error:
+            close = True
+        try:
+            if close or conn.closed:
+                self.discard(conn)
+            else:
+                with self.lock:
+                    self.idle.append((conn, time.monotonic()))
+        finally:
+            self.available.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Checkout a connection for the duration of the with block
+        Connections that failed with a connection level error are closed instead of being reused
+        """
+
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def closeall(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn, _ in idle:
+            self.discard(conn)
@@ -0,0 +1,144 @@
+import io
+import csv
+import json
+
+
+class CopyReader:
+    """
+    File-like object feeding a CSV or NDJSON request body to cursor.copy_expert as COPY ... FROM STDIN (FORMAT csv)
+    The body is read chunk_size bytes at a time, so memory is bounded by the chunk size however big the upload is
+
+    Rows that can't be parsed (wrong number of fields, invalid JSON, unknown keys) are skipped and counted in rejected.
+    Values are not checked against the column types, one that Postgres can't convert fails the whole COPY and nothing is loaded
+
+    NDJSON null is written as an unquoted empty field, which COPY loads as NULL, strings are always quoted so an empty
+    string stays an empty string, objects and arrays are written as JSON
+
+    columns: Column names of the upload, from the columns argument, the CSV header or the keys of the first NDJSON object,
+             stripped and lower cased like the column names of the JSON endpoints (see convertColumnNameToLower)
+    rejected: Number of rows skipped
+    rejected_lines: Line numbers of the first skipped rows
+
+    :param stream: Request body stream
+    :param upload_format: "csv" or "ndjson"
+    :param columns: Column names, None to read them from the body
+    :param header: The first CSV line is a header
+    :param chunk_size: Bytes read from the body at a time
+    """
+
+    max_rejected_lines = 10
+
+    def __init__(self, stream, upload_format: str = "csv", columns: list = None, header: bool = True, chunk_size: int = 65536):
+        self.stream = stream
+        self.upload_format = upload_format
+        self.chunk_size = chunk_size
+        self.rejected = 0
+        self.rejected_lines = []
+        self.line_number = 0
+        self.columns = self.columnNames(columns) if columns is not None else None
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, quoting=csv.QUOTE_MINIMAL)
+
+        if upload_format == "ndjson":
+            self.rows = self.ndjsonRows(columns)
+        else:
+            self.rows = self.csvRows(columns, header)
+        # The first row is read up front to learn the columns before COPY starts
+        self.pending = next(self.rows, None)
+
+    @staticmethod
+    def columnNames(names) -> list:
+        return [str(name).strip().lower() for name in names]
+
+    def lines(self):
+        """
+        Decoded lines of the body, line endings kept so csv.reader can follow quoted newlines
+        """
+
+        remainder = b""
+        while True:
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split(b"\n")
+            remainder = lines.pop()
+            for line in lines:
+                self.line_number += 1
+                yield line.decode("utf-8") + "\n"
+        if remainder:
+            self.line_number += 1
+            yield remainder.decode("utf-8")
+
+    def reject(self) -> None:
+        self.rejected += 1
+        if len(self.rejected_lines) < self.max_rejected_lines:
+            self.rejected_lines.append(self.line_number)
+
+    def csvRows(self, columns: list, header: bool):
+        reader = csv.reader(self.lines())
+        if header:
+            names = next(reader, [])
+            self.columns = self.columnNames(names) if columns is None else self.columns
+        for row in reader:
+            if len(row) == len(self.columns):
+                yield row
+            elif row:
+                self.reject()
+
+    @staticmethod
+    def ndjsonField(value) -> str:
+        """
+        :param value: Decoded JSON value
+        :return: CSV field, empty for null and quoted for strings, objects and arrays
+        """
+
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        elif not isinstance(value, str):
+            # true/false and numbers as JSON spells them
+            return json.dumps(value)
+        return '"' + value.replace('"', '""') + '"'
+
+    def ndjsonRows(self, columns: list):
+        for line in self.lines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                self.reject()
+                continue
+            if not isinstance(record, dict):
+                self.reject()
+                continue
+            record = dict(zip(self.columnNames(record), record.values()))
+            if self.columns is None:
+                self.columns = list(record.keys())
+            if any(key not in self.columns for key in record):
+                self.reject()
+                continue
+            # csv.writer can't tell None from "" apart, NDJSON rows are formatted as finished lines
+            yield ",".join(self.ndjsonField(record.get(column)) for column in self.columns) + "\r\n"
+
+    def read(self, size: int = -1) -> str:
+        """
+        Called by copy_expert until it returns an empty string
+
+        :param size: Characters wanted
+        :return: CSV text
+        """
+
+        size = self.chunk_size if size is None or size < 0 else size
+        while self.buffer.tell() < size and self.pending is not None:
+            if isinstance(self.pending, str):
+                self.buffer.write(self.pending)
+            else:
+                self.writer.writerow(self.pending)
+            self.pending = next(self.rows, None)
+
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return text
@@ -1,4 +1,5 @@
 from flask import jsonify
+from modules.SyntaxSugar.decorators import countError
 
 
 class ErrorHandling:
@@ -12,6 +13,21 @@ class ErrorHandling:
     undefinedColumnError: Column does not exist
     undefinedObjectError: Invalid type
     typeConversionError: Existing column data is incompatible with prospect data
+    invalidPageError: limit or after cursor could not be parsed
+    invalidDataError: Uploaded data could not be loaded into the table
+    invalidPredicateError: Rows to change were not given or the predicate is invalid
+    invalidMatchError: Unknown select_row match mode
+    invalidIndexTypeError: Unknown index type
+    duplicateIndexError: Index already exist
+    undefinedIndexError: Index does not exist
+    extensionUnavailableError: A Postgres extension the operation needs can't be installed on the server
+    invalidAggregateError: Aggregate function, column or group_by is invalid
+    invalidBatchError: Batch operations are malformed or can't run in a batch, nothing was run
+    batchFailedError: An operation of a batch failed, every operation of the batch was rolled back
+    invalidExportFormatError: Unknown export format or its library is not installed
+    invalidStreamError: Unknown get_rows stream format or fetch_size is not a positive integer
+
+    Every error is counted in the flaskapi_errors_total metric by @countError
 
     :param args: tuple
     :param kwargs: dict
@@ -22,34 +38,107 @@ class ErrorHandling:
     def __init__(self, *args, **kwargs):
         self.rollback = kwargs.get('rollback')
 
+    @countError
     def duplicateTableError(self, table: str) -> jsonify:
         self.rollback()
         return {"status": 500, "error": f"Table already exist: {table}"}
 
+    @countError
     def undefinedTableError(self, table: str) -> jsonify:
         self.rollback()
         return {"status": 500, "error": f"Table does not exist: {table}"}
 
+    @countError
     def duplicateColumnError(self, column: str) -> jsonify:
         self.rollback()
         return {"status": 500, "error": f"Column already exist: {column}"}
 
+    @countError
     def undefinedColumnError(self, column: str) -> jsonify:
         self.rollback()
         return {"status": 500, "error": f"Column does not exist: {column}"}
 
+    @countError
     def undefinedObjectError(self, column_type: str) -> jsonify:
         self.rollback()
         return {"status": 500, "error": f"Invalid type: {column_type}"}
 
+    @countError
     def typeConversionError(self, column_type: str) -> jsonify:
         self.rollback()
         return {"status": 500, "error": f"Existing column data is incompatible with prospect data type: {column_type}"}
 
+    @countError
     def inFailedSqlTransactionError(self) -> jsonify:
         self.rollback()
         return {"status": 500, "error": "Failed to execute SQL transaction"}
 
+    @countError
     def syntaxError(self) -> jsonify:
         self.rollback()
         return {"status": 500, "error": "Syntax error: Invalid url or parameters"}
+
+    @countError
+    def invalidPageError(self) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": "Invalid page: limit must be a positive integer and after a cursor returned by a previous page"}
+
+    @countError
+    def invalidStreamError(self, detail: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Invalid stream: {detail}"}
+
+    @countError
+    def invalidDataError(self, detail: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Invalid data: {detail}"}
+
+    @countError
+    def invalidPredicateError(self, detail: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Invalid predicate: {detail}"}
+
+    @countError
+    def invalidMatchError(self, match: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Invalid match: {match}, expected exact, prefix or contains"}
+
+    @countError
+    def invalidIndexTypeError(self, index_type: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Invalid index type: {index_type}, expected btree, prefix or trigram"}
+
+    @countError
+    def duplicateIndexError(self, index: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Index already exist: {index}"}
+
+    @countError
+    def undefinedIndexError(self, index: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Index does not exist: {index}"}
+
+    @countError
+    def extensionUnavailableError(self, extension: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Extension unavailable: {extension} is not installed on the database server or can't be created"}
+
+    @countError
+    def invalidAggregateError(self, detail: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Invalid aggregate: {detail}"}
+
+    @countError
+    def invalidBatchError(self, detail: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Invalid batch: {detail}"}
+
+    @countError
+    def batchFailedError(self, index: int, operation: str, error: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Batch rolled back, operation {index} ({operation}) failed: {error}", "data": {"failed_operation": index}}
+
+    @countError
+    def invalidExportFormatError(self, export_format: str) -> jsonify:
+        self.rollback()
+        return {"status": 500, "error": f"Invalid export format: {export_format}, expected csv, binary, arrow or parquet"}
@@ -0,0 +1,235 @@
+import os
+import queue
+import threading
+
+import psycopg2
+
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# format: (mimetype, file extension)
+exportFormats = {
+    "csv": ("text/csv", "csv"),
+    "binary": ("application/octet-stream", "pgcopy"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Formats built by pyarrow from a CSV COPY
+arrowFormats = ("arrow", "parquet")
+
+
+class QueueWriter:
+    """
+    File-like object handing what is written to it to a bounded queue, chunk_size bytes at a time
+    COPY (or pyarrow) writes into it on a producer thread while the response iterates over it,
+    a full queue blocks the producer so memory stays at maxsize chunks however big the export is
+
+    cancelled: Set when the client went away, the next write raises and stops the producer
+    cancel: Called when the client went away, sets cancelled and runs the callback of cancelWith
+    cancelWith: Callback stopping the producer even while it isn't writing, ex: conn.cancel of a running COPY
+    """
+
+    done = object()
+
+    def __init__(self, maxsize: int = 16, chunk_size: int = 65536):
+        self.queue = queue.Queue(maxsize)
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+        self.cancelled = threading.Event()
+        self.cancelCallback = None
+        self.cancelLock = threading.Lock()
+
+    def cancel(self) -> None:
+        with self.cancelLock:
+            self.cancelled.set()
+            if self.cancelCallback is not None:
+                self.cancelCallback()
+
+    def cancelWith(self, callback) -> None:
+        """
+        :param callback: Called by cancel(), None once whatever it stops is done.
+                         Never running once cancelWith(None) returned, so it can't reach a connection given back to its pool
+        """
+
+        with self.cancelLock:
+            self.cancelCallback = callback
+            if callback is not None and self.cancelled.is_set():
+                callback()
+
+    def put(self, item) -> None:
+        while True:
+            if self.cancelled.is_set():
+                raise BrokenPipeError("Export cancelled, the client disconnected")
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.position += len(data)
+        if len(self.buffer) >= self.chunk_size:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        # pyarrow writers close their sink, the stream only ends with finish()
+        self.closed = True
+
+    def finish(self, error: Exception = None) -> None:
+        """
+        End the stream, called once by the producer
+
+        :param error: Error the producer failed with, raised to the response iterating over the queue
+        """
+
+        if self.buffer and error is None:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+        self.put(error if error is not None else self.done)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is self.done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+def copyTo(pool, query: str, options: str, output, writer: QueueWriter = None) -> int:
+    """
+    Run COPY (query) TO STDOUT on a connection of its own, writing straight into output
+
+    A COPY that stops early (the client went away, output failed) is cancelled and its connection closed,
+    rolling it back would first drain the rest of the COPY while holding a slot of the pool
+
+    :param pool: ConnectionPool
+    :param query: SELECT with its parameters already bound
+    :param options: COPY options, ex: FORMAT csv, HEADER true
+    :param output: File-like object
+    :param writer: QueueWriter of the response, its cancel() cancels the COPY, output itself by default
+    :return: Rows copied
+    """
+
+    writer = writer if writer is not None else output if isinstance(output, QueueWriter) else None
+    conn = pool.getconn()
+    close = False
+    try:
+        if writer is not None:
+            writer.cancelWith(conn.cancel)
+        with conn.cursor() as cur:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH ({options})", output, size=65536)
+            rows = cur.rowcount
+        if writer is not None:
+            writer.cancelWith(None)
+        conn.rollback()
+        return rows
+    except BaseException:
+        close = True
+        if writer is not None:
+            writer.cancelWith(None)
+        try:
+            conn.cancel()
+        except psycopg2.Error:
+            pass
+        raise
+    finally:
+        pool.putconn(conn, close=close)
+
+
+def arrowType(column_type: str):
+    """
+    :param column_type: information_schema data_type
+    :return: Arrow type the CSV column is parsed as, values without an exact Arrow equivalent stay strings
+    """
+
+    return {
+        "smallint": pyarrow.int16(),
+        "integer": pyarrow.int32(),
+        "bigint": pyarrow.int64(),
+        "real": pyarrow.float32(),
+        "double precision": pyarrow.float64(),
+        "boolean": pyarrow.bool_(),
+        "date": pyarrow.date32(),
+        "timestamp without time zone": pyarrow.timestamp("us"),
+    }.get(column_type, pyarrow.string())
+
+
+def copyToArrow(pool, query: str, export_format: str, columns: list, column_types: list, output: QueueWriter, block_size: int) -> int:
+    """
+    COPY the rows out as CSV into a pipe that pyarrow parses into record batches in C++,
+    then write them as an Arrow IPC stream or Parquet row groups, no row is turned into Python objects
+
+    :param pool: ConnectionPool
+    :param query: SELECT with its parameters already bound
+    :param export_format: arrow or parquet
+    :param columns: Column names of the query
+    :param column_types: information_schema data_type of each column
+    :param output: QueueWriter of the response
+    :param block_size: Bytes of CSV parsed per record batch
+    :return: Rows copied
+    """
+
+    schema = pyarrow.schema([(column, arrowType(column_type)) for column, column_type in zip(columns, column_types)])
+    read, write = os.pipe()
+    source = os.fdopen(read, "rb")
+    sink = os.fdopen(write, "wb")
+    copied = {}
+
+    def copy():
+        try:
+            copied["rows"] = copyTo(pool, query, "FORMAT csv", sink, output)
+        except Exception as e:
+            copied["error"] = e
+        finally:
+            try:
+                sink.close()
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=copy, name="export-copy", daemon=True)
+    thread.start()
+    try:
+        if export_format == "parquet":
+            writer = pyarrow.parquet.ParquetWriter(output, schema)
+            write_batch = lambda batch: writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            writer = pyarrow.ipc.new_stream(output, schema)
+            write_batch = writer.write_batch
+
+        # pyarrow refuses an empty CSV, an empty table exports the schema only
+        if source.peek(1):
+            reader = pyarrow.csv.open_csv(
+                source,
+                read_options=pyarrow.csv.ReadOptions(column_names=columns, block_size=block_size),
+                parse_options=pyarrow.csv.ParseOptions(newlines_in_values=True),
+                convert_options=pyarrow.csv.ConvertOptions(column_types=schema, true_values=["t"], false_values=["f"],
+                                                           null_values=[""], strings_can_be_null=True, quoted_strings_can_be_null=False))
+            for batch in reader:
+                write_batch(batch)
+        writer.close()
+    finally:
+        source.close()
+        thread.join()
+    if "error" in copied:
+        raise copied["error"]
+    return copied.get("rows", 0)
@@ -1,19 +1,83 @@
 import os
+import logging
+import threading
 import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+import config
+from flask import has_request_context
+from flask import json
 from flask import jsonify
+from flask import Response
+from flask import stream_with_context
+from modules.classes.ConnectionPool import ConnectionPool
+from modules.classes.CopyReader import CopyReader
 from modules.classes.ErrorHandling import ErrorHandling
+from modules.classes.Export import arrowFormats
+from modules.classes.Export import copyTo
+from modules.classes.Export import copyToArrow
+from modules.classes.Export import exportFormats
+from modules.classes.Export import pyarrow
+from modules.classes.Export import QueueWriter
+from modules.classes.Metrics import InstrumentedCursor
+from modules.classes.Metrics import metrics
+from modules.classes.Pagination import decodeCursor
+from modules.classes.Pagination import encodeCursor
+from modules.classes.QueryBuilder import compileAggregates
+from modules.classes.QueryBuilder import compileColumns
+from modules.classes.QueryBuilder import compileMatch
+from modules.classes.QueryBuilder import compileOrder
+from modules.classes.QueryBuilder import compileWhere
+from modules.classes.QueryBuilder import identifier
+from modules.classes.QueryBuilder import identifierList
+from modules.classes.QueryBuilder import indexName
+from modules.classes.QueryBuilder import indexTypes
+from modules.classes.QueryBuilder import keysetCondition
+from modules.classes.QueryBuilder import matchModes
+from modules.classes.QueryBuilder import numberPlaceholders
+from modules.classes.QueryBuilder import orderClause
+from modules.classes.QueryBuilder import placeholders
+from modules.classes.ReplicaPools import ReplicaPools
+from modules.classes.ResponseCache import ResponseCache
+from modules.classes.SchemaCache import SchemaCache
+from modules.classes.SlowQueryLog import slowQueries
 from modules.classes.SuccessMessages import SuccessMessage
 from modules.security.Authentication import Authentication
-from modules.security.Authentication import invalidAPIKeyError
+from modules.security.Authentication import requireAPIKey
+from modules.security.KeyStore import createKeyStore
+from modules.security.RateLimits import rateLimitKey
 from modules.SyntaxSugar.decorators import convertTableNameToLower
+from modules.SyntaxSugar.decorators import cachedResponse
 from modules.SyntaxSugar.decorators import convertColumnNameToLower
+from modules.SyntaxSugar.decorators import useConnection
+
+
+logger = logging.getLogger(__name__)
+
+# Operations /api/v1/batch accepts, the others can't share a transaction or need more than a JSON body
+batchOperations = ("create_table", "delete_table", "create_column", "delete_column", "update_column_name", "update_column_type",
+                   "insert_row", "insert_rows", "update_row", "delete_row", "update_rows", "delete_rows")
+
+# Functions that only read, routed to a replica when config.REPLICA_DSNS is set
+readOperations = ("get_tables", "get_columns", "get_rows", "select_row", "aggregate", "export")
 
 
 class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
     """
     rollback: Rollback the database to the previous state preventing any crashes
-    conn: Database connection
-    cur: Database cursor
+    pool: Database connection pool of the primary
+    replicas: Connection pools of the read replicas, None when config.REPLICA_DSNS is empty
+    poolFor: Pool a function checks its connection out of, a replica for reads when possible
+    readsOwnWrites: The client wrote recently and reads from the primary, see ReplicaPools
+    warmUp: Open the connections, load the schema cache and prepare common statements before the process takes traffic
+    conn: Database connection checked out by the current thread
+    cur: Database cursor of the current thread
+    sharedSchemaCache: Cached table and column metadata, invalidated by the DDL functions
+    schemaCache: sharedSchemaCache, or the private schema cache of a batch that changed the schema
+    commit: Commit the current transaction unless it belongs to a batch
+    preparedStatements: Run row operations as prepared statements cached on each connection
+    databaseJSON: get_rows and select_row return rows serialised by Postgres (json_agg/row_to_json)
+    responseCache: Serialised responses of get_tables, get_columns, get_rows, select_row and aggregate, invalidated by every write
 
     *** Database functions ***
     get_tables: Get all tables in the database
@@ -22,175 +86,522 @@ class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
     add_column: Add a column to a table in the database
     delete_column: Delete a column from a table in the database
     update_column: Update a column in a table in the database
+    create_index: Create a btree, prefix or trigram index on a column
+    delete_index: Delete an index created by create_index
     add_row: Add a row to a table in the database
     select_row: Select a row from a table in the database
+    aggregate: Count, sum, avg, min or max columns, optionally grouped, or an approximate row count
     insert_row: Insert a row into a table in the database
+    insert_rows: Insert many rows into a table in one transaction
+    import_rows: Load a CSV or NDJSON upload into a table with COPY
     delete_row: Delete a row from a table in the database
     update_row: Update a row in a table in the database
+    update_rows: Update many rows by id list or predicate in one statement
+    delete_rows: Delete many rows by id list or predicate in one statement
+    batch: Run a list of write operations in one transaction
+    export: Stream a table as CSV, Postgres binary, Arrow or Parquet with COPY TO STDOUT
+    slow_queries: Slow statements of this process with their plans, see SlowQueryLog
 
     *** Other ***
-    All functions require api_key, IDEs don't show api_key being used but the variable is used in the wrapper function in __getattribute__
+    All database functions require api_key, IDEs don't show api_key being used but the variable is checked by the wrapper built for @requireAPIKey
+    operations: Registry of the protected database functions, see Authentication.__init_subclass__
     """
 
     def __init__(self):
-        self.conn = psycopg2.connect(
+        self.pool = ConnectionPool(
+            config.POOL_MIN_CONNECTIONS,
+            config.POOL_MAX_CONNECTIONS,
+            timeout=config.POOL_CHECKOUT_TIMEOUT,
+            ping_after=config.POOL_PING_AFTER,
             database=os.environ.get("POSTGRES_DB"),
             user=os.environ.get("POSTGRES_USER"),
             password=os.environ.get("POSTGRES_PASSWORD"),
             host=os.environ.get("POSTGRES_HOST"),
-            port=os.environ.get("POSTGRES_PORT")
+            port=os.environ.get("POSTGRES_PORT"),
+            cursor_factory=InstrumentedCursor
         )
-        self.cur = self.conn.cursor()
-        self.rollback = self.cur.connection.rollback
+        self.replicas = ReplicaPools(
+            config.REPLICA_DSNS,
+            config.POOL_MAX_CONNECTIONS,
+            primary=self.pool,
+            max_lag=config.REPLICA_MAX_LAG,
+            check_interval=config.REPLICA_CHECK_INTERVAL,
+            stickiness=config.READ_YOUR_WRITES_WINDOW,
+            storage_uri=config.READ_YOUR_WRITES_STORAGE_URI,
+            timeout=config.POOL_CHECKOUT_TIMEOUT,
+            ping_after=config.POOL_PING_AFTER,
+            cursor_factory=InstrumentedCursor
+        ) if config.REPLICA_DSNS else None
+        # Connection and cursor are checked out per request by @useConnection
+        self.local = threading.local()
+        self.sharedSchemaCache = SchemaCache(ttl=config.SCHEMA_CACHE_TTL)
+        self.preparedStatements = config.PREPARED_STATEMENTS
+        self.databaseJSON = config.DATABASE_JSON
+        self.responseCache = ResponseCache(maxbytes=config.RESPONSE_CACHE_MAX_BYTES, ttl=config.RESPONSE_CACHE_TTL,
+                                           storage_uri=config.RESPONSE_CACHE_STORAGE_URI)
+        self.rollback = lambda: self.conn.rollback()
         super(FlaskAPI, self).__init__(rollback=self.rollback)
         SuccessMessage.__init__(self)
-        Authentication.__init__(self)
+        Authentication.__init__(self, keyStore=createKeyStore(self.pool))
 
-    def __getattribute__(self, attr: str) -> object:
+    @property
+    def conn(self):
+        return self.local.conn
+
+    @property
+    def cur(self):
+        return self.local.cur
+
+    @property
+    def schemaCache(self) -> SchemaCache:
+        # A batch that changed the schema reads its own uncommitted catalog, see tableModified()
+        return getattr(self.local, 'schemaCache', None) or self.sharedSchemaCache
+
+    def commit(self) -> None:
+        """
+        Commit the current transaction, inside a batch the operations are committed together by batch()
         """
-        Verify the API key passed from the user is valid before executing any function in the class
 
-        :param attr: Attribute to get
-        :return: object
+        if getattr(self.local, 'batch', None) is None:
+            self.conn.commit()
+
+    def poolFor(self, name: str) -> ConnectionPool:
+        """
+        Writes, DDL and batches go to the primary. Reads go to the next usable replica unless
+        the client wrote in the last config.READ_YOUR_WRITES_WINDOW seconds, so it reads its own writes,
+        or the schema catalog has to be reloaded right after a schema change the replicas may not have yet
+
+        :param name: FlaskAPI function
+        :return: ConnectionPool
+        """
+
+        if self.replicas is None or name not in readOperations:
+            return self.pool
+        if self.readsOwnWrites():
+            return self.pool
+        if self.sharedSchemaCache.catalog is None and self.replicas.recentlyWritten("*"):
+            return self.pool
+        return self.replicas.choose() or self.pool
+
+    def readsOwnWrites(self) -> bool:
+        """
+        :return: The client of the current request wrote in the last config.READ_YOUR_WRITES_WINDOW seconds,
+                 its reads go to the primary
         """
 
-        attribute = object.__getattribute__(self, attr)
+        return self.replicas is not None and has_request_context() and self.replicas.sticky(rateLimitKey())
 
-        # Get all functions in the FlaskAPI class
-        allowedAttributes = [func for func in dir(__class__.__name__) if callable(getattr(__class__.__name__, func)) and not any(x in func for x in ['__', 'success', 'Error', 'api'])]
+    def tableModified(self, table_name: str, schema: bool = False) -> None:
+        """
+        Invalidate what is cached about a table, called after a write is committed
 
-        if callable(attribute) and attribute.__name__ in allowedAttributes:
-            def wrapper(*args, **kwargs) -> object:
-                """
-                Wrapper function to check the API key before executing the function
+        Inside a batch nothing is committed yet, so the invalidation is deferred until batch() commits.
+        A schema change switches the batch to a private schema cache, later operations of the batch see its DDL
+        and the shared cache never holds uncommitted tables or columns
 
-                :param args: args[0] is the API key passed from the user
-                :param kwargs: kwargs['api_key'] is the API key passed from the user
-                :return: object
-                """
+        :param table_name: Table that changed
+        :param schema: The table was created, deleted or its columns changed
+        """
 
-                if self.check_api_key(api_key=kwargs.get('api_key')):
-                    return attribute(*args, **kwargs)
+        batch = getattr(self.local, 'batch', None)
+        if batch is not None:
+            batch.append((table_name, schema))
+            if schema:
+                if getattr(self.local, 'schemaCache', None) is None:
+                    self.local.schemaCache = SchemaCache(ttl=config.SCHEMA_CACHE_TTL)
                 else:
-                    return invalidAPIKeyError()
+                    self.local.schemaCache.invalidate(table_name)
+            return
+
+        self.responseCache.bump(table_name)
+        if schema:
+            self.sharedSchemaCache.invalidate(table_name)
+            self.responseCache.bump("*")
+        if self.replicas is not None:
+            client = rateLimitKey() if has_request_context() else None
+            self.replicas.wrote(client, table_name)
+            if schema:
+                self.replicas.wrote(client, "*")
+
+    def columnNames(self, table_name: str) -> list:
+        """
+        Column names of a table in column order, from the schema cache
+
+        :param table_name: Table name
+        :return: List of column names
+        """
+
+        columns = self.schemaCache.getColumns(self.cur, table_name)
+        if columns is None:
+            raise psycopg2.errors.UndefinedTable
+        return [column["column_name"] for column in columns]
+
+    def execute(self, query: sql.Composable, params: list) -> None:
+        """
+        Execute a row operation with bound parameters
+
+        With preparedStatements on, the query is prepared once per connection and run with EXECUTE afterwards,
+        so repeated operations on the same table and columns skip parsing and planning.
+        The statement is keyed on its text, which is determined by the operation, the table and the column set,
+        and on the schema version of this process.
+        DDL from another worker, another client or before a TTL reload doesn't bump that version, when it changes the
+        result type of a statement Postgres refuses to run it (FeatureNotSupported), it is then deallocated and the
+        query runs unprepared. The statement is rolled back to a savepoint, or the transaction rolled back when the
+        statement started it, so the rest of the transaction is kept
+
+        :param query: Query with %s placeholders
+        :param params: Values for the placeholders
+        """
+
+        # Statements are keyed on the shared schema version, a batch on a private schema cache runs them unprepared
+        if not self.preparedStatements or getattr(self.local, 'schemaCache', None) is not None:
+            self.cur.execute(query, params)
+            return
+
+        # Nothing to keep when the statement begins the transaction (PREPARE isn't undone by a rollback),
+        # otherwise the EXECUTE is sent behind a savepoint in the same round trip
+        savepoint = self.conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        name = self.prepare(query)
+        if params:
+            statement = sql.SQL("EXECUTE {} ({})").format(sql.Identifier(name), placeholders(len(params)))
+        else:
+            statement = sql.SQL("EXECUTE {}").format(sql.Identifier(name))
+        if savepoint:
+            statement = sql.SQL("SAVEPOINT flaskapi_execute; ") + statement
+        try:
+            self.cur.execute(statement, params)
+        except psycopg2.errors.FeatureNotSupported:
+            if savepoint:
+                self.cur.execute("ROLLBACK TO SAVEPOINT flaskapi_execute; RELEASE SAVEPOINT flaskapi_execute")
+            else:
+                self.conn.rollback()
+            self.conn.deallocate(self.cur, (query.as_string(self.conn), self.schemaCache.version))
+            self.cur.execute(query, params)
+            return
+        if savepoint:
+            # On a cursor of its own, the results of the EXECUTE stay on self.cur
+            with self.conn.cursor(cursor_factory=psycopg2.extensions.cursor) as releaseCursor:
+                releaseCursor.execute("RELEASE SAVEPOINT flaskapi_execute")
+
+    def prepare(self, query: sql.Composable) -> str:
+        """
+        :param query: Query with %s placeholders
+        :return: Name of the statement prepared for query on the current connection, see execute()
+        """
+
+        text = query.as_string(self.conn)
+        return self.conn.prepare(self.cur, (text, self.schemaCache.version), numberPlaceholders(text), config.PREPARED_STATEMENT_CACHE_SIZE)
+
+    def warmUp(self) -> None:
+        """
+        Get the process ready before it takes traffic: open the pool connections (see ConnectionPool.open()),
+        load the schema cache, create the key store table, check the replicas
+        and prepare the insert_row (every column) and delete_row statements of each table on every pooled connection,
+        so the first requests of a new worker don't pay for any of it
+
+        Called by create_app(), or by the gunicorn post_worker_init hook when the app is preloaded in the master
+        """
+
+        connections = [self.pool.getconn() for _ in range(max(config.POOL_MIN_CONNECTIONS, 1))]
+        try:
+            for conn in connections:
+                self.local.conn, self.local.cur = conn, conn.cursor()
+                try:
+                    tables = [table["table_name"] for table in self.schemaCache.getTables(self.cur)]
+                    if not self.preparedStatements:
+                        break
+                    # Two statements per table, the connection keeps PREPARED_STATEMENT_CACHE_SIZE of them
+                    for table_name in tables[:config.PREPARED_STATEMENT_CACHE_SIZE // 2]:
+                        names = self.columnNames(table_name)
+                        columns = [column for column in names if column != "id"]
+                        if columns:
+                            self.prepare(sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(identifier(table_name), identifierList(columns), placeholders(len(columns))))
+                        if "id" in names:
+                            self.prepare(sql.SQL("DELETE FROM {} WHERE id = %s").format(identifier(table_name)))
+                    conn.commit()
+                finally:
+                    self.local.cur.close()
+                    self.local.conn = self.local.cur = None
+        finally:
+            for conn in connections:
+                self.pool.putconn(conn)
+
+        if hasattr(self.keyStore, "create"):
+            self.keyStore.create()
+        if self.replicas is not None:
+            for pool in self.replicas.pools:
+                self.replicas.usable(pool)
+
+    def columnType(self, table_name: str, column_name: str) -> str:
+        """
+        :param table_name: Table name
+        :param column_name: Column name
+        :return: Column type from the schema cache
+        """
+
+        for column in self.schemaCache.getColumns(self.cur, table_name) or []:
+            if column["column_name"] == column_name:
+                return column["column_type"]
+        raise psycopg2.errors.UndefinedColumn(f'column "{column_name}" does not exist')
+
+    def rowFilter(self, table_name: str, data: dict) -> tuple:
+        """
+        Condition selecting the rows targeted by a bulk operation
+
+        :param table_name: Table name
+        :param data: {"row_ids": [1, 2, 3]} or {"where": {"column_name": "column_value"}}, see compileWhere()
+        :return: (sql.Composable condition with %s placeholders, list of parameters)
+        """
+
+        if data.get("row_ids") is not None:
+            return sql.SQL("id = ANY(%s)"), [[int(row_id) for row_id in data["row_ids"]]]
+        if data.get("where") is not None:
+            return compileWhere(data["where"], self.columnNames(table_name))
+        raise ValueError("row_ids or where is required")
+
+    def selectRows(self, table_name: str, columns: list, where: sql.Composable, params: list, data: dict, order: tuple = (None, False)):
+        """
+        Select rows matching where, paginated when data has a limit or an after cursor
+
+        Pages use keyset pagination on the order column and the id column every table gets from create_table,
+        so page N costs the same index range scan as page 1
+
+        :param table_name: Table name
+        :param columns: Column names to return
+        :param where: SQL condition with %s placeholders
+        :param params: Values for the placeholders
+        :param data: Request data, optional {"limit": 100, "after": "cursor"}
+        :param order: (order column or None for id, descending) from compileOrder(), rows are unordered if neither is set and not paginated
+        :return: List of rows, or {"data": [rows], "next": "cursor"} when paginated, next is null on the last page
+                 With databaseJSON on, the same JSON as a Response built by selectJSON()
+        """
+
+        column, descending = order
+        paginated = data.get("limit") is not None or data.get("after") is not None
+        # Columns the cursor is built from are selected even when the client did not ask for them
+        keys = (["id", column] if column else ["id"]) if paginated else []
+        hidden = [key for key in keys if key not in columns]
+        selected = columns + hidden
+        orderName = f"{column or 'id'} {'desc' if descending else 'asc'}"
+
+        query = sql.SQL("SELECT {} FROM {} WHERE ({})").format(identifierList(selected), identifier(table_name), where)
+        limit = None
+        if paginated:
+            limit = int(data.get("limit") or config.DEFAULT_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError(f"Invalid limit: {limit}")
+            if data.get("after"):
+                condition, keyParams = keysetCondition(column, descending, *decodeCursor(data["after"], orderName))
+                query += sql.SQL(" AND {}").format(condition)
+                params = params + keyParams
+        ordered = paginated or column is not None or descending
+        if ordered:
+            query += sql.SQL(" ORDER BY {}").format(orderClause(column, descending))
+        if paginated:
+            query += sql.SQL(" LIMIT %s")
+            params = params + [limit]
 
-            return wrapper
-        return object.__getattribute__(self, attr)
+        if self.databaseJSON:
+            body, count, last = self.selectJSON(query, params, columns, hidden, order if ordered else None, paginated)
+            if paginated:
+                body = '{"data":' + body + ',"next":' + json.dumps(encodeCursor(last[0], orderName, last[1]) if count == limit else None) + '}'
+            return Response(body, mimetype="application/json")
+
+        self.execute(query, params)
+        fetched = self.cur.fetchall()
+        rows = [dict(zip(columns, row)) for row in fetched]
+        if not paginated:
+            return rows
+        cursor = None
+        if len(fetched) == limit:
+            last = fetched[-1]
+            cursor = encodeCursor(last[selected.index("id")], orderName, last[selected.index(column)] if column else None)
+        return {"data": rows, "next": cursor}
+
+    def selectJSON(self, query: sql.Composable, params: list, columns: list, hidden: list, order, last: bool) -> tuple:
+        """
+        Run a row query with Postgres building the JSON, the rows come back as a single json_agg text value
+        that is passed through to the response without being decoded into Python objects
+
+        :param query: Row query with %s placeholders
+        :param params: Values for the placeholders
+        :param columns: Columns of the JSON objects
+        :param hidden: Columns the query selects for the cursor only, left out of the JSON
+        :param order: (order column or None for id, descending) the query is ordered by, None if unordered
+        :param last: Also return the id and order column value of the last row
+        :return: (JSON list of rows, row count, (id, order column value) of the last row or None)
+        """
+
+        row = sql.SQL("page")
+        if hidden:
+            row = sql.SQL("(SELECT line FROM (SELECT {}) AS line)").format(sql.SQL(", ").join(sql.Identifier("page", column) for column in columns))
+        aggregateOrder = sql.SQL(" ORDER BY {}").format(orderClause(*order, alias="page")) if order else sql.SQL("")
+        lastRow = sql.SQL(", NULL, NULL")
+        if last:
+            lastKey = sql.SQL("(array_agg({}{}))[count(*)::int]").format(sql.Identifier("page", order[0]), aggregateOrder) if order[0] else sql.SQL("NULL")
+            lastRow = sql.SQL(", (array_agg(page.id{}))[count(*)::int], {}").format(aggregateOrder, lastKey)
+
+        self.execute(sql.SQL("SELECT coalesce(json_agg({}{}), '[]')::text, count(*){} FROM ({}) AS page").format(row, aggregateOrder, lastRow, query), params)
+        body, count, lastId, lastKey = self.cur.fetchone()
+        # One aggregated value is fetched, record the rows it holds
+        self.cur.rows += count - 1
+        return body, count, (lastId, lastKey)
+
+    def streamRows(self, table_name: str, columns: list, stream_format: str, fetch_size: int,
+                   where: sql.Composable = sql.SQL("TRUE"), params: list = None, order: tuple = (None, False)) -> Response:
+        """
+        Stream every row of a table through a server-side cursor, fetch_size rows per round trip,
+        so memory stays flat however big the table is
+        With databaseJSON on, each row arrives serialised by row_to_json and is written out as is
+
+        The generator checks out its own connection because it runs after the request handler has returned
+
+        :param table_name: Table name, already checked against the schema cache
+        :param columns: Column names in column order
+        :param stream_format: "ndjson" for one JSON object per line, "json" for a JSON array
+        :param fetch_size: Rows fetched per round trip
+        :param where: SQL condition with %s placeholders
+        :param params: Values for the placeholders
+        :param order: (order column or None for id, descending) from compileOrder(), rows are unordered if neither is set
+        :return: Streamed response
+        """
+
+        ndjson = stream_format == "ndjson"
+        query = sql.SQL("SELECT {} FROM {} WHERE ({})").format(identifierList(columns), identifier(table_name), where)
+        if order[0] is not None or order[1]:
+            query += sql.SQL(" ORDER BY {}").format(orderClause(*order))
+        databaseJSON = self.databaseJSON
+        if databaseJSON:
+            query = sql.SQL("SELECT row_to_json(line)::text FROM ({}) AS line").format(query)
+
+        pool = self.local.pool
+
+        def generate():
+            with pool.connection() as conn:
+                with conn.cursor(name="get_rows_stream") as cur:
+                    cur.itersize = fetch_size
+                    cur.execute(query, params or [])
+                    if not ndjson:
+                        yield "["
+                    separator = ""
+                    count = 0
+                    for row in cur:
+                        count += 1
+                        line = row[0] if databaseJSON else json.dumps(dict(zip(columns, row)))
+                        if ndjson:
+                            yield line + "\n"
+                        else:
+                            yield separator + line
+                            separator = ","
+                    if not ndjson:
+                        yield "]"
+                    # Iterating a named cursor bypasses fetchmany, the streamed rows are recorded here
+                    metrics.function("get_rows").rows.observe(count)
+                conn.rollback()
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson" if ndjson else "application/json")
 
     # TODO: Test response when no tables exist
     #       Unable to test with current Postgres database without delete other users tables
     #       Test with a new database
+    @requireAPIKey
+    @cachedResponse
+    @useConnection
     def get_tables(self, api_key: str) -> jsonify:
         """
         Get all tables in the database
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :return: JSON list of tables
         """
 
         try:
-            self.cur.execute("SELECT * FROM information_schema.tables WHERE table_schema = 'public'")
-            tables = self.cur.fetchall()
-
-            tablesJSON = []
-            for table in tables:
-                tableJSON = {
-                    "table_schema": table[1],
-                    "table_name": table[2],
-                    "table_type": table[3]
-                }
-                tablesJSON.append(tableJSON)
-            return jsonify(tablesJSON)
+            return jsonify(self.schemaCache.getTables(self.cur))
         except psycopg2.errors.InFailedSqlTransaction:
             return self.inFailedSqlTransactionError()
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     def create_table(self, api_key: str, data: dict) -> jsonify:
         """
         Create a new table in the database
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name"}
         :return: {"success": "Message"}
         """
 
         try:
             self.cur.execute(f"CREATE TABLE {data['table_name']} (id SERIAL PRIMARY KEY)")
-            self.conn.commit()
+            self.commit()
+            self.tableModified(data['table_name'], schema=True)
             return self.success("create_table", data={"table_name": data['table_name']})
         except psycopg2.errors.DuplicateTable:
             return self.duplicateTableError(data['table_name'])
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     def delete_table(self, api_key: str, data: dict) -> jsonify:
         """
         Delete a table in the database
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name"}
         :return: {"success": "Message"}
         """
 
         try:
             self.cur.execute(f"DROP TABLE {data['table_name']}")
-            self.conn.commit()
+            self.commit()
+            self.tableModified(data['table_name'], schema=True)
             return self.success("delete_table", data={"table_name": data['table_name']})
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data['table_name'])
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
 
+    @requireAPIKey
+    @cachedResponse
+    @useConnection
     @convertTableNameToLower
     def get_columns(self, api_key: str, data: dict) -> jsonify:
         """
         Get all columns in a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name"}
         :return: JSON list of columns
         """
 
         try:
-            self.cur.execute(f"SELECT * FROM information_schema.columns WHERE table_name = '{data['table_name']}'")
-            columns = self.cur.fetchall()
-
-            # If no columns are found, check if the table exists
-            if len(columns) == 0:
-                self.cur.execute("SELECT * FROM information_schema.tables WHERE table_schema = 'public'")
-                tables = self.cur.fetchall()
-
-                if data["table_name"] not in [table[2] for table in tables]:
-                    raise psycopg2.errors.UndefinedTable
-
-            else:
-                columnsJSON = []
-                for column in columns:
-                    columnJSON = {
-                        "column_name": column[3],
-                        "column_order": column[4],
-                        "column_type": column[7]
-                    }
-                    columnsJSON.append(columnJSON)
-                return jsonify(columnsJSON)
+            columns = self.schemaCache.getColumns(self.cur, data['table_name'])
+            if columns is None:
+                raise psycopg2.errors.UndefinedTable
+            return jsonify(columns)
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data["table_name"])
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     @convertColumnNameToLower
     def create_column(self, api_key: str, data: dict) -> jsonify:
         """
         Create a column in a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name", "column_name": "column_name", "column_type": "column_type"}
         :return: {"success": "Message"}
         """
 
         try:
             self.cur.execute(f"ALTER TABLE {data['table_name']} ADD COLUMN {data['column_name']} {data['column_type']}")
-            self.conn.commit()
+            self.commit()
+            self.tableModified(data['table_name'], schema=True)
             return self.success("create_column", {"table_name": data['table_name'], "column_name": data['column_name']})
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data['table_name'])
@@ -201,20 +612,23 @@ class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     @convertColumnNameToLower
     def delete_column(self, api_key: str, data: dict) -> jsonify:
         """
         Delete a column in a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name", "column_name": "column_name"}
         :return: {"success": "Message"}
         """
 
         try:
             self.cur.execute(f"ALTER TABLE {data['table_name']} DROP COLUMN {data['column_name']}")
-            self.conn.commit()
+            self.commit()
+            self.tableModified(data['table_name'], schema=True)
             return self.success("delete_column", data={"table_name": data['table_name'], "column_name": data['column_name']})
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data['table_name'])
@@ -223,20 +637,23 @@ class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     @convertColumnNameToLower
     def update_column_name(self, api_key: str, data: dict) -> jsonify:
         """
         Update a column name in a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name", "column_name": "column_name", "new_column_name": "new_column_name"}
         :return: {"success": "Message"}
         """
 
         try:
             self.cur.execute(f"ALTER TABLE {data['table_name']} RENAME COLUMN {data['column_name']} TO {data['new_column_name']}")
-            self.conn.commit()
+            self.commit()
+            self.tableModified(data['table_name'], schema=True)
             return self.success("update_column_name", data={"table_name": data['table_name'], "column_name": data['column_name'], "new_column_name": data['new_column_name']})
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data['table_name'])
@@ -247,20 +664,23 @@ class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     @convertColumnNameToLower
     def update_column_type(self, api_key: str, data: dict) -> jsonify:
         """
         Update a column type in a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name", "column_name": "column_name", "new_column_type": "new_column_type"}
         :return: {"success": "Message"}
         """
 
         try:
             self.cur.execute(f"ALTER TABLE {data['table_name']} ALTER COLUMN {data['column_name']} TYPE {data['new_column_type']} USING {data['column_name']}::{data['new_column_type']}")
-            self.conn.commit()
+            self.commit()
+            self.tableModified(data['table_name'], schema=True)
             return self.success("update_column_type", data={"table_name": data['table_name'], "column_name": data['column_name'], "new_column_type": data['new_column_type']})
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data['table_name'])
@@ -275,32 +695,170 @@ class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
         except Exception as e:
             return self.typeConversionError(str(e).split(' ')[5].replace(':', ''))
 
+    @requireAPIKey
+    @useConnection
+    @convertTableNameToLower
+    @convertColumnNameToLower
+    def create_index(self, api_key: str, data: dict) -> jsonify:
+        """
+        Create an index on a column so select_row lookups don't scan the whole table
+
+        btree: exact matches (select_row match=exact), also used by ranges and sorting
+        prefix: prefix matches (select_row match=prefix)
+        trigram: substring matches (select_row match=contains), installs the pg_trgm extension if needed
+
+        The index is built with CREATE INDEX CONCURRENTLY so writes to the table are not blocked while it is built.
+        A build that fails drops the invalid index it leaves behind, one left by an earlier failure is rebuilt
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "column_name": "column_name", "index_type": "btree" | "prefix" | "trigram"}
+        :return: {"success": "Message"}
+        """
+
+        index_type = data.get("index_type", "btree")
+        if index_type not in indexTypes:
+            return self.invalidIndexTypeError(index_type)
+        name = indexName(data['table_name'], data['column_name'], index_type)
+
+        create = sql.SQL("CREATE INDEX CONCURRENTLY {} ON {} USING " + indexTypes[index_type]).format(
+            sql.Identifier(name), identifier(data['table_name']), identifier(data['column_name']))
+        # CONCURRENTLY can't run inside a transaction block
+        self.conn.rollback()
+        self.conn.autocommit = True
+        try:
+            if index_type == "trigram":
+                try:
+                    self.cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.UndefinedFile, psycopg2.errors.InsufficientPrivilege):
+                    return self.extensionUnavailableError("pg_trgm")
+            try:
+                self.cur.execute(create)
+            except psycopg2.errors.DuplicateTable:
+                # Left behind by a build that failed, built again
+                if not self.dropInvalidIndex(name):
+                    raise
+                self.cur.execute(create)
+            return self.success("create_index", data={"table_name": data['table_name'], "column_name": data['column_name'], "data": {"index_name": name}})
+        except psycopg2.errors.UndefinedTable:
+            return self.undefinedTableError(data['table_name'])
+        except psycopg2.errors.UndefinedColumn:
+            return self.undefinedColumnError(data['column_name'])
+        except psycopg2.errors.DuplicateTable:
+            return self.duplicateIndexError(name)
+        except (psycopg2.errors.UndefinedObject, psycopg2.errors.UndefinedFunction):
+            return self.invalidIndexTypeError(index_type)
+        except psycopg2.errors.SyntaxError:
+            return self.syntaxError()
+        except psycopg2.Error:
+            # A build that failed once it started leaves an invalid index, the next attempt would be a duplicate
+            try:
+                self.dropInvalidIndex(name)
+            except psycopg2.Error:
+                pass
+            raise
+        finally:
+            self.conn.autocommit = False
+
+    def dropInvalidIndex(self, name: str) -> bool:
+        """
+        Drop an index a failed CREATE INDEX CONCURRENTLY left behind, marked invalid, runs in autocommit
+
+        :param name: Index name
+        :return: An invalid index was dropped
+        """
+
+        self.cur.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(quote_ident(%s))", [name])
+        row = self.cur.fetchone()
+        if row is None or not row[0]:
+            return False
+        self.cur.execute(sql.SQL("DROP INDEX CONCURRENTLY {}").format(sql.Identifier(name)))
+        return True
+
+    @requireAPIKey
+    @useConnection
+    @convertTableNameToLower
+    @convertColumnNameToLower
+    def delete_index(self, api_key: str, data: dict) -> jsonify:
+        """
+        Delete an index created by create_index
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "column_name": "column_name", "index_type": "btree" | "prefix" | "trigram"}
+        :return: {"success": "Message"}
+        """
+
+        index_type = data.get("index_type", "btree")
+        if index_type not in indexTypes:
+            return self.invalidIndexTypeError(index_type)
+        name = indexName(data['table_name'], data['column_name'], index_type)
+
+        try:
+            self.cur.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(name)))
+            self.commit()
+            return self.success("delete_index", data={"table_name": data['table_name'], "column_name": data['column_name'], "data": {"index_name": name}})
+        except psycopg2.errors.UndefinedObject:
+            return self.undefinedIndexError(name)
+        except psycopg2.errors.SyntaxError:
+            return self.syntaxError()
+
+    @requireAPIKey
+    @cachedResponse
+    @useConnection
     @convertTableNameToLower
     def get_rows(self, api_key: str, data: dict) -> jsonify:
         """
         Get rows from a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
-        :param data: {"table_name": "table_name"}
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "columns": ["column_name"], "where": {"column_name": {"gte": 1}}, "order_by": "column_name", "order": "asc" | "desc",
+                      "limit": 100, "after": "cursor", "stream": "ndjson" | "json", "fetch_size": 2000}
+                     columns, where, order_by and order are optional, see compileColumns(), compileWhere() and compileOrder()
+                     limit and after are optional, see selectRows()
+                     stream and fetch_size are optional, see streamRows()
         :return: {"success": "Message", "data": [{"column_name": "column_value"}]}
         """
 
         try:
-            columns = [header["column_name"] for header in sorted(self.get_columns(api_key, data).json, key=lambda d: d['column_order'])]
-            self.cur.execute(f"SELECT * FROM {data['table_name']}")
-            self.conn.commit()
-            return [dict(zip(columns, row)) for row in self.cur.fetchall()]
+            known = self.columnNames(data['table_name'])
+            try:
+                columns = compileColumns(data.get("columns"), known)
+                order = compileOrder(data.get("order_by"), data.get("order"), known)
+                where, params = compileWhere(data["where"], known) if data.get("where") is not None else (sql.SQL("TRUE"), [])
+            except ValueError as e:
+                return self.invalidPredicateError(str(e))
+            if data.get("stream"):
+                # Checked before the response starts, an error inside the stream would follow a 200
+                if data["stream"] not in ("ndjson", "json"):
+                    return self.invalidStreamError(f"{data['stream']}, expected ndjson or json")
+                try:
+                    fetch_size = int(data.get("fetch_size", config.STREAM_FETCH_SIZE))
+                except (TypeError, ValueError):
+                    fetch_size = 0
+                if fetch_size < 1:
+                    return self.invalidStreamError("fetch_size must be a positive integer")
+                return self.streamRows(data['table_name'], columns, data["stream"], fetch_size, where, params, order)
+            rows = self.selectRows(data['table_name'], columns, where, params, data, order)
+            self.commit()
+            return rows
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data['table_name'])
+        except psycopg2.errors.UndefinedColumn as e:
+            return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
+        except (psycopg2.DataError, psycopg2.errors.UndefinedFunction) as e:
+            return self.invalidPredicateError(str(e).splitlines()[0])
+        except ValueError:
+            return self.invalidPageError()
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     def insert_row(self, api_key: str, data: dict) -> jsonify:
         """
         Insert a row into a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name", "row_data": {"column_name": "column_value"}}
         :return: {"success": "Message"}
         """
@@ -309,11 +867,11 @@ class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
             table_name = data["table_name"]
             data.pop("table_name")
 
-            columns = ", ".join(data['row_data'].keys())
-            values = ", ".join([f"'{value}'" for value in data['row_data'].values()])
-
-            self.cur.execute(f"INSERT INTO {table_name} ({columns}) VALUES ({values})")
-            self.conn.commit()
+            columns = list(data['row_data'].keys())
+            self.execute(sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(identifier(table_name), identifierList(columns), placeholders(len(columns))),
+                         list(data['row_data'].values()))
+            self.commit()
+            self.tableModified(table_name)
             return self.success("insert_row", {"table_name": table_name, 'data': data})
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data["table_name"])
@@ -322,35 +880,201 @@ class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
 
+    @requireAPIKey
+    @useConnection
+    @convertTableNameToLower
+    def insert_rows(self, api_key: str, data: dict) -> jsonify:
+        """
+        Insert many rows into a table in one transaction
+
+        Consecutive rows with the same columns are sent as multi-row INSERT ... VALUES statements
+        of config.BULK_INSERT_PAGE_SIZE rows each, one commit for the whole request
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "rows": [{"column_name": "column_value"}, ...]}
+        :return: {"success": "Message", "data": {"row_count": 2, "ids": [1, 2]}}
+        """
+
+        table_name = data["table_name"]
+        try:
+            ids = []
+            rows = data["rows"]
+            start = 0
+            while start < len(rows):
+                columns = list(rows[start].keys())
+                end = start
+                while end < len(rows) and list(rows[end].keys()) == columns:
+                    end += 1
+
+                result = execute_values(self.cur,
+                                        sql.SQL("INSERT INTO {} ({}) VALUES %s RETURNING id").format(identifier(table_name), identifierList(columns)),
+                                        [tuple(row.values()) for row in rows[start:end]],
+                                        page_size=config.BULK_INSERT_PAGE_SIZE,
+                                        fetch=True)
+                ids.extend(row[0] for row in result)
+                start = end
+
+            self.commit()
+            self.tableModified(table_name)
+            return self.success("insert_rows", {"table_name": table_name, "data": {"row_count": len(ids), "ids": ids}})
+        except psycopg2.errors.UndefinedTable:
+            return self.undefinedTableError(table_name)
+        except psycopg2.errors.UndefinedColumn as e:
+            return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
+        except psycopg2.errors.SyntaxError:
+            return self.syntaxError()
+
+    @requireAPIKey
+    @useConnection
+    @convertTableNameToLower
+    def import_rows(self, api_key: str, data: dict, stream) -> jsonify:
+        """
+        Load a CSV or NDJSON upload into a table with COPY FROM STDIN
+        The body is streamed into COPY config.IMPORT_CHUNK_SIZE bytes at a time, it is never held in memory whole
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: Query string {"table_name": "table_name", "format": "csv" | "ndjson", "columns": "a,b,c", "header": "true"}
+                     format defaults to csv, header (csv only) defaults to true
+                     columns defaults to the CSV header, the keys of the first NDJSON object, or every column for a CSV without header
+        :param stream: Request body stream
+        :return: {"success": "Message", "data": {"rows_loaded": 2, "rows_rejected": 1, "rejected_lines": [3]}}
+        """
+
+        table_name = data["table_name"]
+        try:
+            known = self.columnNames(table_name)
+            header = data.get("header", "true").lower() == "true"
+            # Stripped and lower cased by CopyReader, like the CSV header and the NDJSON keys
+            columns = data["columns"].split(",") if data.get("columns") else None
+            if columns is None and not header and data.get("format", "csv") == "csv":
+                columns = known
+
+            reader = CopyReader(stream, data.get("format", "csv"), columns, header, config.IMPORT_CHUNK_SIZE)
+            for column in reader.columns or []:
+                if column not in known:
+                    return self.undefinedColumnError(column)
+
+            loaded = 0
+            if reader.columns:
+                copy = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(identifier(table_name), identifierList(reader.columns))
+                self.cur.copy_expert(copy.as_string(self.cur), reader, size=config.IMPORT_CHUNK_SIZE)
+                loaded = self.cur.rowcount
+            self.commit()
+            self.tableModified(table_name)
+            return self.success("import_rows", {"table_name": table_name, "data": {"rows_loaded": loaded, "rows_rejected": reader.rejected, "rejected_lines": reader.rejected_lines}})
+        except psycopg2.errors.UndefinedTable:
+            return self.undefinedTableError(table_name)
+        except psycopg2.errors.UndefinedColumn as e:
+            return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
+        except (psycopg2.DataError, psycopg2.IntegrityError, UnicodeDecodeError) as e:
+            return self.invalidDataError(str(e).splitlines()[0])
+        except psycopg2.errors.SyntaxError:
+            return self.syntaxError()
+
+    @requireAPIKey
+    @cachedResponse
+    @useConnection
     @convertTableNameToLower
     @convertColumnNameToLower
     def select_row(self, api_key: str, data: dict) -> jsonify:
         """
         Select a row from a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
-        :param data: {"table_name": "table_name", "column_name": "column_name", "column_value": "column_value"}
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "column_name": "column_name", "column_value": "column_value", "match": "contains", "limit": 100, "after": "cursor"}
+                     match is exact, prefix or contains (default), see compileMatch() and create_index()
+                     limit and after are optional, see selectRows()
         :return: {"success": "Message", "data": [{"column_name": "column_value"}]}
         """
 
+        if data.get('match', 'contains') not in matchModes:
+            return self.invalidMatchError(data.get('match'))
+
         try:
-            columns = [header["column_name"] for header in sorted(self.get_columns(api_key, data).json, key=lambda d: d['column_order'])]
-            self.cur.execute(f"SELECT * FROM {data['table_name']} WHERE {data['column_name']} LIKE '%{data['column_value']}%'")
-            self.conn.commit()
-            return [dict(zip(columns, row)) for row in self.cur.fetchall()]
+            columns = self.columnNames(data['table_name'])
+            column_type = self.columnType(data['table_name'], data['column_name'])
+            where, params = compileMatch(data['column_name'], data['column_value'], data.get('match', 'contains'), column_type)
+            rows = self.selectRows(data['table_name'], columns, where, params, data)
+            self.commit()
+            return rows
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data['table_name'])
         except psycopg2.errors.UndefinedColumn as e:
             return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
+        except ValueError:
+            return self.invalidPageError()
+
+    @requireAPIKey
+    @cachedResponse
+    @useConnection
+    @convertTableNameToLower
+    def aggregate(self, api_key: str, data: dict) -> jsonify:
+        """
+        Count, sum, average, min or max columns in Postgres, optionally per group, so clients never pull a table to aggregate it
+
+        With approximate, the row count is read from the planner statistics (pg_class.reltuples) instead of scanning the table,
+        tables estimated below config.APPROXIMATE_COUNT_MIN_ROWS or never analyzed are still counted exactly
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "aggregates": [{"function": "count"}, {"function": "sum", "column_name": "column_name"}],
+                      "group_by": ["column_name"], "where": {"column_name": "column_value"}}
+                     {"table_name": "table_name", "approximate": true}
+                     group_by and where are optional, see compileAggregates() and compileWhere()
+        :return: [{"column_name": "group value", "count": 3, "sum_column_name": 42}], one row per group ordered by the group_by columns
+                 [{"count": 1000000, "approximate": true}] for an approximate count
+        """
+
+        table_name = data["table_name"]
+        try:
+            columns = self.columnNames(table_name)
+            if data.get("approximate"):
+                self.cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [f'public."{table_name}"'])
+                row = self.cur.fetchone()
+                estimate = row[0] if row else -1
+                if estimate >= config.APPROXIMATE_COUNT_MIN_ROWS:
+                    self.commit()
+                    return [{"count": estimate, "approximate": True}]
+                self.cur.execute(sql.SQL("SELECT count(*) FROM {}").format(identifier(table_name)))
+                count = self.cur.fetchone()[0]
+                self.commit()
+                return [{"count": count, "approximate": False}]
+
+            try:
+                selected, groups = compileAggregates(data.get("aggregates"), data.get("group_by"), columns)
+                where, params = compileWhere(data["where"], columns) if data.get("where") is not None else (sql.SQL("TRUE"), [])
+            except ValueError as e:
+                return self.invalidAggregateError(str(e))
+
+            query = sql.SQL("SELECT {} FROM {} WHERE ({})").format(selected, identifier(table_name), where)
+            if groups is not None:
+                query += sql.SQL(" GROUP BY {0} ORDER BY {0}").format(groups)
+            if self.databaseJSON:
+                rows = Response(self.selectJSON(query, params, [], [], None, False)[0], mimetype="application/json")
+            else:
+                self.execute(query, params)
+                names = [column.name for column in self.cur.description]
+                rows = [dict(zip(names, row)) for row in self.cur.fetchall()]
+            self.commit()
+            return rows
+        except psycopg2.errors.UndefinedTable:
+            return self.undefinedTableError(table_name)
+        except psycopg2.errors.UndefinedColumn as e:
+            return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
+        except (psycopg2.DataError, psycopg2.errors.UndefinedFunction) as e:
+            return self.invalidAggregateError(str(e).splitlines()[0])
+        except psycopg2.errors.SyntaxError:
+            return self.syntaxError()
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     def update_row(self, api_key: str, data: dict) -> jsonify:
         """
         Update a specific row in a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name", "row_id": "row_id", "new_row_data": {"column_name": "column_value"}}
         :return: {"success": "Message"}
         """
@@ -362,36 +1086,274 @@ class FlaskAPI(ErrorHandling, SuccessMessage, Authentication):
             row_id = data["row_id"]
             data.pop("row_id")
 
-            columns = ", ".join(data["new_row_data"].keys())
-            values = ", ".join([f"'{value}'" for value in data["new_row_data"].values()])
-
-            self.cur.execute(f"UPDATE {table_name} SET ({columns}) = ({values}) WHERE id = {row_id}")
-            self.conn.commit()
+            assignments = sql.SQL(", ").join(sql.SQL("{} = %s").format(identifier(column)) for column in data["new_row_data"].keys())
+            self.execute(sql.SQL("UPDATE {} SET {} WHERE id = %s").format(identifier(table_name), assignments),
+                         list(data["new_row_data"].values()) + [int(row_id)])
+            self.commit()
+            self.tableModified(table_name)
             return self.success("update_row", {'table_name': table_name, 'data': data})
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data["table_name"])
         except psycopg2.errors.UndefinedColumn as e:
             return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
-        except psycopg2.errors.SyntaxError:
+        except (psycopg2.errors.SyntaxError, ValueError):
             return self.syntaxError()
 
+    @requireAPIKey
+    @useConnection
     @convertTableNameToLower
     def delete_row(self, api_key: str, data: dict) -> jsonify:
         """
         Delete a specific row in a table
 
-        :param api_key: API key from the request header, used to authenticate the user in __getattribute__()
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
         :param data: {"table_name": "table_name", "row_id": "row_id"}
         :return: {"success": "Message"}
         """
 
         try:
-            self.cur.execute(f"DELETE FROM {data['table_name']} WHERE id = {data['row_id']}")
-            self.conn.commit()
+            self.execute(sql.SQL("DELETE FROM {} WHERE id = %s").format(identifier(data['table_name'])), [int(data['row_id'])])
+            self.commit()
+            self.tableModified(data['table_name'])
             return self.success("delete_row", {"table_name": data['table_name'], 'row_id': data['row_id'], 'data': data})
         except psycopg2.errors.UndefinedTable:
             return self.undefinedTableError(data['table_name'])
         except psycopg2.errors.UndefinedColumn as e:
             return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
+        except (psycopg2.errors.SyntaxError, ValueError):
+            return self.syntaxError()
+
+    @requireAPIKey
+    @useConnection
+    @convertTableNameToLower
+    def update_rows(self, api_key: str, data: dict) -> jsonify:
+        """
+        Update many rows in one transaction, either
+        the same new_row_data on every row matched by row_ids or where, as one UPDATE ... WHERE id = ANY(...) statement
+        or different data per row, as an UPDATE joined to jsonb_populate_recordset so Postgres converts the values to the column types
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "row_ids": [1, 2], "new_row_data": {"column_name": "column_value"}}
+                     {"table_name": "table_name", "where": {"column_name": "column_value"}, "new_row_data": {"column_name": "column_value"}}
+                     {"table_name": "table_name", "rows": [{"id": 1, "column_name": "column_value"}, {"id": 2, "column_name": "column_value"}]}
+        :return: {"success": "Message", "data": {"row_count": 2}}
+        """
+
+        table_name = data["table_name"]
+        try:
+            if data.get("rows") is not None:
+                count = 0
+                rows = data["rows"]
+                start = 0
+                while start < len(rows):
+                    columns = [column for column in rows[start].keys() if column != "id"]
+                    end = start
+                    while end < len(rows) and list(rows[end].keys()) == list(rows[start].keys()):
+                        end += 1
+
+                    assignments = sql.SQL(", ").join(sql.SQL("{} = v.{}").format(identifier(column), identifier(column)) for column in columns)
+                    self.cur.execute(sql.SQL("UPDATE {0} SET {1} FROM jsonb_populate_recordset(NULL::{0}, %s::jsonb) AS v WHERE {0}.id = v.id").format(identifier(table_name), assignments),
+                                     (json.dumps(rows[start:end]),))
+                    count += self.cur.rowcount
+                    start = end
+            else:
+                where, params = self.rowFilter(table_name, data)
+                assignments = sql.SQL(", ").join(sql.SQL("{} = %s").format(identifier(column)) for column in data["new_row_data"].keys())
+                self.execute(sql.SQL("UPDATE {} SET {} WHERE {}").format(identifier(table_name), assignments, where), list(data["new_row_data"].values()) + params)
+                count = self.cur.rowcount
+
+            self.commit()
+            self.tableModified(table_name)
+            return self.success("update_rows", {"table_name": table_name, "data": {"row_count": count}})
+        except psycopg2.errors.UndefinedTable:
+            return self.undefinedTableError(table_name)
+        except psycopg2.errors.UndefinedColumn as e:
+            return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
+        except psycopg2.errors.SyntaxError:
+            return self.syntaxError()
+        except (KeyError, ValueError, TypeError, psycopg2.DataError) as e:
+            return self.invalidPredicateError(str(e).splitlines()[0])
+
+    @requireAPIKey
+    @useConnection
+    @convertTableNameToLower
+    def delete_rows(self, api_key: str, data: dict) -> jsonify:
+        """
+        Delete every row matched by row_ids or where in one statement
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "row_ids": [1, 2]} or {"table_name": "table_name", "where": {"column_name": "column_value"}}
+        :return: {"success": "Message", "data": {"row_count": 2}}
+        """
+
+        table_name = data["table_name"]
+        try:
+            where, params = self.rowFilter(table_name, data)
+            self.execute(sql.SQL("DELETE FROM {} WHERE {}").format(identifier(table_name), where), params)
+            count = self.cur.rowcount
+            self.commit()
+            self.tableModified(table_name)
+            return self.success("delete_rows", {"table_name": table_name, "data": {"row_count": count}})
+        except psycopg2.errors.UndefinedTable:
+            return self.undefinedTableError(table_name)
+        except psycopg2.errors.UndefinedColumn as e:
+            return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
         except psycopg2.errors.SyntaxError:
             return self.syntaxError()
+        except (ValueError, TypeError, psycopg2.DataError) as e:
+            return self.invalidPredicateError(str(e).splitlines()[0])
+
+    @requireAPIKey
+    @useConnection
+    def batch(self, api_key: str, data: dict) -> jsonify:
+        """
+        Run a list of operations on one connection in a single transaction, the API key is checked once for the whole batch
+        The first failing operation rolls back every operation of the batch
+
+        Only operations that can share a transaction are accepted (see batchOperations),
+        create_index and delete_index build indexes concurrently outside a transaction and import_rows reads the request body
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"operations": [{"operation": "create_table", "data": {"table_name": "table_name"}},
+                                     {"operation": "insert_row", "data": {"table_name": "table_name", "row_data": {"column_name": "column_value"}}}]}
+        :return: {"success": "Message", "data": {"results": [result of each operation]}}
+        """
+
+        operations = data.get("operations") if isinstance(data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return self.invalidBatchError("operations must be a non-empty list")
+        if len(operations) > config.BATCH_MAX_OPERATIONS:
+            return self.invalidBatchError(f"at most {config.BATCH_MAX_OPERATIONS} operations per batch")
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or not isinstance(operation.get("data"), dict):
+                return self.invalidBatchError(f"operation {index} must be {{\"operation\": \"name\", \"data\": {{...}}}}")
+            if operation.get("operation") not in batchOperations:
+                return self.invalidBatchError(f"operation {index}: {operation.get('operation')} can't run in a batch, expected one of {', '.join(batchOperations)}")
+
+        self.local.batch = []
+        try:
+            results = []
+            for index, operation in enumerate(operations):
+                name = operation["operation"]
+                try:
+                    result = self.operations[name](self, api_key=api_key, data=dict(operation["data"]))
+                except (KeyError, TypeError, AttributeError, psycopg2.Error) as e:
+                    result = {"status": 500, "error": f"{type(e).__name__}: {e}"}
+                if isinstance(result, Response):
+                    result = result.get_json()
+                if isinstance(result, dict) and "error" in result:
+                    return self.batchFailedError(index, name, result["error"])
+                results.append(result)
+
+            self.conn.commit()
+            modified = self.local.batch
+        finally:
+            self.local.batch = None
+            self.local.schemaCache = None
+
+        for table_name, schema in modified:
+            self.tableModified(table_name, schema)
+        return self.success("batch", {"data": {"results": results}})
+
+    @requireAPIKey
+    @useConnection
+    @convertTableNameToLower
+    def export(self, api_key: str, data: dict) -> Response:
+        """
+        Stream a table out with COPY (SELECT ...) TO STDOUT, no row is fetched into Python
+
+        COPY runs on a producer thread with a connection of its own and writes into a bounded queue the response reads from,
+        so memory stays at config.EXPORT_QUEUE_SIZE chunks of config.EXPORT_CHUNK_SIZE bytes whatever the size of the export.
+        arrow and parquet need pyarrow, which parses the CSV COPY output into record batches, see copyToArrow()
+        The query is checked before streaming starts, an error once rows are flowing is logged, counted as exportInterruptedError
+        and ends the response early without its terminating chunk, so clients see a truncated transfer rather than a short file.
+        A client going away cancels the COPY, see copyTo()
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: {"table_name": "table_name", "format": "csv" | "binary" | "arrow" | "parquet", "columns": ["column_name"],
+                      "where": {"column_name": "column_value"}, "header": true}
+                     format defaults to csv, header (csv only) defaults to true, columns and where are optional like in get_rows
+        :return: Streamed file, binary is the Postgres binary COPY format
+        """
+
+        table_name = data["table_name"]
+        export_format = data.get("format", "csv")
+        if export_format not in exportFormats:
+            return self.invalidExportFormatError(export_format)
+        if export_format in arrowFormats and pyarrow is None:
+            return self.invalidExportFormatError(f"{export_format} needs pyarrow, pip install pyarrow")
+
+        try:
+            known = self.schemaCache.getColumns(self.cur, table_name)
+            if known is None:
+                raise psycopg2.errors.UndefinedTable
+            types = {column["column_name"]: column["column_type"] for column in known}
+            try:
+                columns = compileColumns(data.get("columns"), list(types))
+                where, params = compileWhere(data["where"], list(types)) if data.get("where") is not None else (sql.SQL("TRUE"), [])
+            except ValueError as e:
+                return self.invalidPredicateError(str(e))
+            # COPY takes no parameters, they are bound client side
+            query = self.cur.mogrify(sql.SQL("SELECT {} FROM {} WHERE ({})").format(identifierList(columns), identifier(table_name), where), params).decode()
+            self.cur.execute(f"{query} LIMIT 0")
+            self.commit()
+        except psycopg2.errors.UndefinedTable:
+            return self.undefinedTableError(table_name)
+        except psycopg2.errors.UndefinedColumn as e:
+            return self.undefinedColumnError(str(e).split(" ")[1].strip('"'))
+        except (psycopg2.DataError, psycopg2.errors.UndefinedFunction) as e:
+            return self.invalidPredicateError(str(e).splitlines()[0])
+
+        header = str(data.get("header", True)).lower() == "true"
+        pool = self.local.pool
+        writer = QueueWriter(config.EXPORT_QUEUE_SIZE, config.EXPORT_CHUNK_SIZE)
+
+        def produce():
+            try:
+                if export_format in arrowFormats:
+                    rows = copyToArrow(pool, query, export_format, columns, [types[column] for column in columns], writer, config.EXPORT_BATCH_BYTES)
+                else:
+                    options = "FORMAT binary" if export_format == "binary" else f"FORMAT csv, HEADER {str(header).lower()}"
+                    rows = copyTo(pool, query, options, writer)
+                metrics.function("export").rows.observe(rows)
+                writer.finish()
+            except Exception as e:
+                if not writer.cancelled.is_set():
+                    # The 200 and maybe some rows are already sent, the response is cut short without its last chunk
+                    logger.error(f"Export of {table_name} ({export_format}) failed after the response started: {e}")
+                    metrics.function("export").error("exportInterruptedError")
+                try:
+                    writer.finish(e)
+                except BrokenPipeError:
+                    pass
+
+        def generate():
+            threading.Thread(target=produce, name="export", daemon=True).start()
+            try:
+                yield from writer
+            finally:
+                writer.cancel()
+
+        mimetype, extension = exportFormats[export_format]
+        response = Response(generate(), mimetype=mimetype)
+        response.headers["Content-Disposition"] = f'attachment; filename="{table_name}.{extension}"'
+        return response
+
+    @requireAPIKey
+    def slow_queries(self, api_key: str, data: dict) -> jsonify:
+        """
+        Statements of this worker process that took config.SLOW_QUERY_THRESHOLD seconds or more, newest first
+        Sampled SELECTs carry their EXPLAIN (ANALYZE, BUFFERS) plan and the sequential scans in it, see SlowQueryLog
+        The log isn't shared between gunicorn workers, worker is the pid of the process that answered
+
+        :param api_key: API key from the request header, used to authenticate the user in @requireAPIKey
+        :param data: Optional {"seq_scans": true} to only list statements with a sequential scan of config.SLOW_QUERY_SEQ_SCAN_ROWS rows or more
+        :return: {"worker": pid, "threshold": seconds, "recorded": count, "explained": count,
+                  "data": [{"time": epoch, "endpoint": "get_rows", "query": "redacted SQL", "duration": seconds, "rows": rows,
+                            "plan": {...} or null, "seq_scans": [{"table": "table_name", "rows": rows, "large": true}]}]}
+        """
+
+        entries = slowQueries.entries()
+        if (data or {}).get("seq_scans"):
+            entries = [entry for entry in entries if any(scan["large"] for scan in entry["seq_scans"])]
+        return jsonify({"worker": os.getpid(), "threshold": config.SLOW_QUERY_THRESHOLD, "recorded": slowQueries.recorded, "explained": slowQueries.explained, "data": entries})
@@ -0,0 +1,41 @@
+import config
+from modules.classes.Metrics import InstrumentedJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(InstrumentedJSONProvider):
+    """
+    Flask JSON provider encoding with orjson, several times faster than the stdlib encoder on lists of rows
+    Output matches the default provider: sorted keys, dates as HTTP dates and decimals as strings (through DefaultJSONProvider.default)
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def createJSONProvider(app):
+    """
+    JSON provider named by config.JSON_PROVIDER: auto (orjson when installed), orjson or json
+
+    :param app: Flask app
+    :return: JSON provider to set as app.json
+    """
+
+    name = config.JSON_PROVIDER
+    if name == "orjson" and orjson is None:
+        raise ImportError("JSON_PROVIDER is orjson but orjson is not installed: pip install orjson")
+    if name in ("auto", "orjson") and orjson is not None:
+        return OrjsonProvider(app)
+    return InstrumentedJSONProvider(app)
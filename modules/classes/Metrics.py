@@ -0,0 +1,278 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from flask import has_request_context
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from psycopg2 import extensions
+from modules.classes.SlowQueryLog import slowQueries
+
+
+secondsBuckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+rowBuckets = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def workerLabel(line: str, worker: str) -> str:
+    """
+    :param line: Line in Prometheus text format
+    :param worker: Rendered worker label, ex: worker="1234"
+    :return: Sample line with the worker label added first, comment lines as they were
+    """
+
+    if not line or line.startswith("#"):
+        return line
+    end = line.find("{")
+    if end == -1 or end > line.find(" "):
+        name, value = line.split(" ", 1)
+        return f"{name}{{{worker}}} {value}"
+    return f"{line[:end + 1]}{worker},{line[end + 1:]}"
+
+
+class Histogram:
+    """
+    Prometheus histogram with fixed buckets, observing a value is one bisect and one locked increment
+
+    :param buckets: Upper bounds of the buckets in increasing order, +Inf is implied
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "lock")
+
+    def __init__(self, buckets: tuple = secondsBuckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self, name: str, labels: str) -> list:
+        """
+        :param name: Metric name
+        :param labels: Rendered labels, ex: function="get_rows"
+        :return: Lines in Prometheus text format
+        """
+
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {total}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class OperationMetrics:
+    """
+    Histograms and counters of one endpoint or FlaskAPI function, created on first use and kept for the life of the process
+    so recording a request allocates nothing
+
+    latency: Seconds spent in the endpoint or function
+    serialise: Seconds spent serialising JSON responses
+    execute: Seconds spent in cursor.execute/copy_expert per call
+    fetch: Seconds spent fetching results per call
+    rows: Rows returned or affected per call
+    pool_wait: Seconds waited for a pooled connection
+    errors: {ErrorHandling method name: count}
+    """
+
+    __slots__ = ("latency", "serialise", "execute", "fetch", "rows", "pool_wait", "errors", "lock")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.serialise = Histogram()
+        self.execute = Histogram()
+        self.fetch = Histogram()
+        self.rows = Histogram(rowBuckets)
+        self.pool_wait = Histogram()
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def error(self, name: str) -> None:
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class Metrics:
+    """
+    Process wide registry of the request metrics, rendered in Prometheus text format on /metrics
+
+    Nothing is shared between processes: under gunicorn each worker keeps its own metrics and a scrape of /metrics
+    is answered by whichever worker accepted it. Every sample carries a worker="<pid>" label so the series of different
+    workers never mix, sum them without the worker label (ex: sum without (worker) (...)) for totals of the server.
+    Series of a worker that is restarted stop and new ones start under its new pid
+
+    endpoint: Metrics of a Flask endpoint (whole request: latency, serialisation)
+    function: Metrics of a FlaskAPI function (database work: latency, execute, fetch, rows, pool wait, errors)
+    current: The FlaskAPI function running on this thread, errors are counted against it
+    error: Count an ErrorHandling error
+    startup: {phase: seconds since app.py started importing}, see create_app()
+    collect: Add a callable returning more Prometheus text lines to render
+    render: Every metric in Prometheus text format
+    """
+
+    families = (
+        ("flaskapi_request_seconds", "Request latency by endpoint", "endpoints", "endpoint", "latency"),
+        ("flaskapi_serialise_seconds", "Time spent serialising JSON responses by endpoint", "endpoints", "endpoint", "serialise"),
+        ("flaskapi_function_seconds", "FlaskAPI function latency", "functions", "function", "latency"),
+        ("flaskapi_db_execute_seconds", "Time spent in cursor.execute per function call", "functions", "function", "execute"),
+        ("flaskapi_db_fetch_seconds", "Time spent fetching results per function call", "functions", "function", "fetch"),
+        ("flaskapi_db_rows", "Rows returned or affected per function call", "functions", "function", "rows"),
+        ("flaskapi_pool_wait_seconds", "Time waited for a pooled connection", "functions", "function", "pool_wait"),
+    )
+
+    def __init__(self):
+        self.endpoints = {}
+        self.functions = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.startup = {}
+        self.collectors = []
+
+    def operation(self, registry: dict, name: str) -> OperationMetrics:
+        operation = registry.get(name)
+        if operation is None:
+            with self.lock:
+                operation = registry.setdefault(name, OperationMetrics())
+        return operation
+
+    def endpoint(self, name: str) -> OperationMetrics:
+        return self.operation(self.endpoints, name or "none")
+
+    def function(self, name: str) -> OperationMetrics:
+        return self.operation(self.functions, name)
+
+    @property
+    def current(self):
+        return getattr(self.local, 'function', None)
+
+    @current.setter
+    def current(self, operation: OperationMetrics) -> None:
+        self.local.function = operation
+
+    def collect(self, collector) -> None:
+        """
+        :param collector: Callable returning a list of Prometheus text lines, called on every render
+        """
+
+        self.collectors.append(collector)
+
+    def error(self, name: str) -> None:
+        (self.current or self.function("none")).error(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric, description, registry, label, attribute in self.families:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} histogram")
+            for name, operation in sorted(getattr(self, registry).items()):
+                lines.extend(getattr(operation, attribute).render(metric, f'{label}="{name}"'))
+
+        lines.append("# HELP flaskapi_errors_total Errors returned by FlaskAPI functions by ErrorHandling type")
+        lines.append("# TYPE flaskapi_errors_total counter")
+        for name, operation in sorted(self.functions.items()):
+            with operation.lock:
+                errors = sorted(operation.errors.items())
+            for error, count in errors:
+                lines.append(f'flaskapi_errors_total{{function="{name}",error="{error}"}} {count}')
+
+        lines.append("# HELP flaskapi_slow_queries_total Statements slower than SLOW_QUERY_THRESHOLD, see /api/v1/slow-queries")
+        lines.append("# TYPE flaskapi_slow_queries_total counter")
+        lines.append(f"flaskapi_slow_queries_total {slowQueries.recorded}")
+
+        lines.append("# HELP flaskapi_startup_seconds Seconds from the start of the app import to each startup phase of this process")
+        lines.append("# TYPE flaskapi_startup_seconds gauge")
+        for phase, seconds in sorted(self.startup.items()):
+            lines.append(f'flaskapi_startup_seconds{{phase="{phase}"}} {seconds}')
+
+        for collector in self.collectors:
+            lines.extend(collector())
+        worker = f'worker="{os.getpid()}"'
+        return "\n".join(workerLabel(line, worker) for line in lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class InstrumentedCursor(extensions.cursor):
+    """
+    Cursor adding up the time spent executing and fetching and the rows returned or affected,
+    @useConnection records the totals once the function returns
+    Every statement is also handed to the slow query log, see SlowQueryLog.record()
+
+    execute_time: Seconds spent in execute/copy_expert
+    fetch_time: Seconds spent in fetchone/fetchmany/fetchall
+    rows: Rows fetched, plus rows affected by statements returning no rows
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedCursor, self).__init__(*args, **kwargs)
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.rows = 0
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super(InstrumentedCursor, self).execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.execute_time += elapsed
+            if self.description is None and self.rowcount > 0:
+                self.rows += self.rowcount
+            # Named cursors only DECLARE here, their rows come later
+            if self.name is None:
+                slowQueries.record(self, query, vars, elapsed, max(self.rowcount, 0))
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super(InstrumentedCursor, self).copy_expert(sql, file, size)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.execute_time += elapsed
+            if self.rowcount > 0:
+                self.rows += self.rowcount
+            slowQueries.record(self, sql, None, elapsed, max(self.rowcount, 0))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super(InstrumentedCursor, self).fetchone()
+        self.fetch_time += time.perf_counter() - start
+        if row is not None:
+            self.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super(InstrumentedCursor, self).fetchmany(self.arraysize if size is None else size)
+        self.fetch_time += time.perf_counter() - start
+        self.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super(InstrumentedCursor, self).fetchall()
+        self.fetch_time += time.perf_counter() - start
+        self.rows += len(rows)
+        return rows
+
+
+class InstrumentedJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider timing the serialisation of jsonify() and dict responses by endpoint
+    """
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super(InstrumentedJSONProvider, self).response(*args, **kwargs)
+        if has_request_context():
+            metrics.endpoint(request.endpoint).serialise.observe(time.perf_counter() - start)
+        return response
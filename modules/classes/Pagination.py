@@ -0,0 +1,36 @@
+import json
+import base64
+
+
+def encodeCursor(row_id: int, order: str = "id asc", key=None) -> str:
+    """
+    Opaque cursor pointing after a row, clients pass it back as "after" to get the next page
+
+    :param row_id: id of the last row of the page
+    :param order: Sort order of the page, ex: "pokemon_name desc"
+    :param key: Value of the order column in the last row of the page
+    :return: str
+    """
+
+    cursor = {"id": row_id}
+    if order != "id asc":
+        cursor.update(order=order, key=key)
+    return base64.urlsafe_b64encode(json.dumps(cursor, default=str).encode()).decode()
+
+
+def decodeCursor(cursor: str, order: str = "id asc") -> tuple:
+    """
+    :param cursor: Cursor returned by encodeCursor
+    :param order: Sort order of the requested page, must be the order the cursor was made for
+    :return: (id, order column value) of the last row of the previous page
+    :raises ValueError: The cursor was not made by encodeCursor or was made for another order
+    """
+
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        row_id = int(decoded["id"])
+    except (TypeError, KeyError, AttributeError, json.JSONDecodeError, base64.binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if decoded.get("order", "id asc") != order:
+        raise ValueError(f"Invalid cursor: {cursor} was made for another order")
+    return row_id, decoded.get("key")
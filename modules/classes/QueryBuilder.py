@@ -0,0 +1,301 @@
+import re
+import hashlib
+import itertools
+import psycopg2
+from psycopg2 import sql
+
+
+def identifier(name: str) -> sql.Identifier:
+    """
+    Quoted identifier, lower cased like Postgres folds unquoted names so "Pokemon_Name" still matches pokemon_name
+
+    :param name: Table or column name
+    """
+
+    return sql.Identifier(name.lower())
+
+
+def identifierList(names: list) -> sql.Composed:
+    return sql.SQL(", ").join(identifier(name) for name in names)
+
+
+def placeholders(count: int) -> sql.Composed:
+    return sql.SQL(", ").join(sql.Placeholder() * count)
+
+
+def numberPlaceholders(query: str) -> str:
+    """
+    Turn the %s placeholders of a composed query into the $1, $2 ... parameters PREPARE expects
+
+    :param query: Query text with %s placeholders and %% escapes
+    :return: Query text with numbered parameters
+    """
+
+    count = itertools.count(1)
+    return re.sub(r"%%|%s", lambda match: "%" if match.group() == "%%" else f"${next(count)}", query)
+
+
+whereOperators = {
+    "eq": "{} = %s",
+    "ne": "{} <> %s",
+    "lt": "{} < %s",
+    "lte": "{} <= %s",
+    "gt": "{} > %s",
+    "gte": "{} >= %s",
+    "in": "{} = ANY(%s)",
+}
+
+
+def compileCondition(column: str, operator: str, value) -> tuple:
+    """
+    :param column: Column name, already checked
+    :param operator: Key of whereOperators or is_null
+    :param value: Operand, a list for in and a boolean for is_null
+    :return: (sql.Composed condition, list of parameters)
+    :raises ValueError: Unknown operator or operand of the wrong type
+    """
+
+    if operator == "is_null":
+        if not isinstance(value, bool):
+            raise ValueError(f"is_null of {column} must be true or false")
+        return sql.SQL("{} IS NULL" if value else "{} IS NOT NULL").format(identifier(column)), []
+    if operator not in whereOperators:
+        raise ValueError(f"Unknown operator {operator} on {column}, expected one of {', '.join(list(whereOperators) + ['is_null'])}")
+    if operator == "in" and not isinstance(value, list):
+        raise ValueError(f"in of {column} must be a list")
+    if value is None or isinstance(value, dict):
+        raise ValueError(f"{operator} of {column} must be a value, use is_null to match nulls")
+    return sql.SQL(whereOperators[operator]).format(identifier(column)), [value]
+
+
+def compileWhere(where: dict, columns: list) -> tuple:
+    """
+    Compile a predicate into a parameterised SQL condition, every column is checked against the table's columns
+
+    {"column_name": "value"}: column_name = value
+    {"column_name": null}: column_name IS NULL
+    {"column_name": {"gte": 1, "lt": 10}}: Ranges with eq, ne, lt, lte, gt, gte
+    {"column_name": {"in": ["a", "b"]}}: column_name = ANY(ARRAY['a', 'b'])
+    {"column_name": {"is_null": false}}: column_name IS NOT NULL
+    Conditions on several columns, or several operators on one column, are combined with AND
+
+    :param where: Predicate
+    :param columns: Column names of the table
+    :return: (sql.Composed condition with %s placeholders, list of parameters)
+    :raises ValueError: The predicate is not a non-empty object or uses an unknown operator
+    :raises psycopg2.errors.UndefinedColumn: The predicate names a column the table does not have
+    """
+
+    if not isinstance(where, dict) or not where:
+        raise ValueError("where must be an object of {column_name: value}")
+
+    conditions = []
+    params = []
+    for column, value in where.items():
+        column = column.lower()
+        if column not in columns:
+            raise psycopg2.errors.UndefinedColumn(f'column "{column}" does not exist')
+        if value is None:
+            conditions.append(sql.SQL("{} IS NULL").format(identifier(column)))
+        elif isinstance(value, dict):
+            if not value:
+                raise ValueError(f"Conditions of {column} must be a non-empty object")
+            for operator, operand in value.items():
+                condition, operandParams = compileCondition(column, operator, operand)
+                conditions.append(condition)
+                params.extend(operandParams)
+        else:
+            conditions.append(sql.SQL("{} = %s").format(identifier(column)))
+            params.append(value)
+    return sql.SQL(" AND ").join(conditions), params
+
+
+def compileColumns(selected, columns: list) -> list:
+    """
+    Column projection of get_rows
+
+    :param selected: Column names asked for, None for every column
+    :param columns: Column names of the table in column order
+    :return: Column names to select, lower cased and without duplicates
+    :raises ValueError: selected is not a non-empty list
+    :raises psycopg2.errors.UndefinedColumn: A column the table does not have
+    """
+
+    if selected is None:
+        return columns
+    if not isinstance(selected, list) or not selected:
+        raise ValueError("columns must be a non-empty list of column names")
+
+    names = list(dict.fromkeys(str(name).lower() for name in selected))
+    for name in names:
+        if name not in columns:
+            raise psycopg2.errors.UndefinedColumn(f'column "{name}" does not exist')
+    return names
+
+
+def compileOrder(order_by, order, columns: list) -> tuple:
+    """
+    Sort order of get_rows, rows with equal values are ordered by id so pages are stable
+
+    :param order_by: Column name, None to order by id
+    :param order: "asc" (default) or "desc"
+    :param columns: Column names of the table
+    :return: (column name or None for id, descending)
+    :raises ValueError: order is not asc or desc
+    :raises psycopg2.errors.UndefinedColumn: A column the table does not have
+    """
+
+    order = str(order or "asc").lower()
+    if order not in ("asc", "desc"):
+        raise ValueError(f"order must be asc or desc, not {order}")
+    if order_by is None:
+        return None, order == "desc"
+
+    column = str(order_by).lower()
+    if column not in columns:
+        raise psycopg2.errors.UndefinedColumn(f'column "{column}" does not exist')
+    return (None if column == "id" else column), order == "desc"
+
+
+def orderClause(column: str, descending: bool, alias: str = None) -> sql.Composed:
+    """
+    :param column: Order column, None to order by id only
+    :param descending: Descending order
+    :param alias: Table alias the columns are qualified with
+    :return: ORDER BY list, nulls sort last in both directions
+    """
+
+    direction = sql.SQL("DESC" if descending else "ASC")
+    name = (lambda name: sql.Identifier(alias, name)) if alias else identifier
+    terms = [sql.SQL("{} {} NULLS LAST").format(name(column), direction)] if column else []
+    terms.append(sql.SQL("{} {}").format(name("id"), direction))
+    return sql.SQL(", ").join(terms)
+
+
+def keysetCondition(column: str, descending: bool, row_id: int, key) -> tuple:
+    """
+    Condition selecting the rows after a page in orderClause() order
+
+    :param column: Order column, None to order by id only
+    :param descending: Descending order
+    :param row_id: id of the last row of the previous page
+    :param key: Order column value of the last row of the previous page
+    :return: (sql.Composed condition with %s placeholders, list of parameters)
+    """
+
+    operator = sql.SQL("<" if descending else ">")
+    if column is None:
+        return sql.SQL("id {} %s").format(operator), [row_id]
+    if key is None:
+        # Nulls sort last, after a null only nulls with a further id remain
+        return sql.SQL("({} IS NULL AND id {} %s)").format(identifier(column), operator), [row_id]
+    return sql.SQL("(({}, id) {} (%s, %s) OR {} IS NULL)").format(identifier(column), operator, identifier(column)), [key, row_id]
+
+
+aggregateFunctions = ("count", "sum", "avg", "min", "max")
+
+
+def compileAggregates(aggregates: list, group_by, columns: list) -> tuple:
+    """
+    Select list of an aggregate query, every column is checked against the table's columns
+
+    {"function": "count"}: count(*) AS count
+    {"function": "sum", "column_name": "attack"}: sum(attack) AS sum_attack
+    group_by columns are selected first, each aggregate is named function_column
+
+    :param aggregates: List of {"function": "count" | "sum" | "avg" | "min" | "max", "column_name": "column_name"}
+    :param group_by: List of column names, None for a single row over the whole table
+    :param columns: Column names of the table
+    :return: (sql.Composed select list, sql.Composed GROUP BY list or None)
+    :raises ValueError: Unknown function, missing column or malformed arguments
+    :raises psycopg2.errors.UndefinedColumn: A column the table does not have
+    """
+
+    if not isinstance(aggregates, list) or not aggregates:
+        raise ValueError("aggregates must be a non-empty list of {function, column_name}")
+    groups = compileColumns(group_by, columns) if group_by is not None else []
+
+    selected = [identifier(column) for column in groups]
+    names = set(groups)
+    for aggregate in aggregates:
+        if not isinstance(aggregate, dict) or aggregate.get("function") not in aggregateFunctions:
+            raise ValueError(f"function must be one of {', '.join(aggregateFunctions)}")
+        function = aggregate["function"]
+        column = aggregate.get("column_name")
+        if column is None:
+            if function != "count":
+                raise ValueError(f"{function} needs a column_name")
+            target, name = sql.SQL("*"), "count"
+        else:
+            column = str(column).lower()
+            if column not in columns:
+                raise psycopg2.errors.UndefinedColumn(f'column "{column}" does not exist')
+            target, name = identifier(column), f"{function}_{column}"
+        if name in names:
+            raise ValueError(f"{name} is selected twice")
+        names.add(name)
+        selected.append(sql.SQL("{}({}) AS {}").format(sql.SQL(function), target, sql.Identifier(name)))
+
+    groupClause = sql.SQL(", ").join(identifier(column) for column in groups) if groups else None
+    return sql.SQL(", ").join(selected), groupClause
+
+
+textTypes = ("text", "character varying", "character")
+
+matchModes = ("exact", "prefix", "contains")
+
+indexTypes = {
+    # B-tree for exact matches, ranges and sorting
+    "btree": "btree ({})",
+    # B-tree with pattern ops so LIKE 'value%' can use it whatever the collation
+    "prefix": "btree ({} text_pattern_ops)",
+    # Trigram GIN from pg_trgm for LIKE '%value%'
+    "trigram": "gin ({} gin_trgm_ops)"
+}
+
+
+def escapeLike(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def compileMatch(column: str, value, match: str, column_type: str) -> tuple:
+    """
+    Condition for select_row
+
+    exact: column = value, works on every type and uses a btree index
+    prefix: column LIKE 'value%', uses a prefix index
+    contains: column LIKE '%value%', uses a trigram index
+    prefix and contains compare non text columns as text, no index is used for those
+
+    :param column: Column name
+    :param value: Value to match
+    :param match: exact, prefix or contains
+    :param column_type: Column type from the schema cache
+    :return: (sql.Composed condition with a %s placeholder, list of parameters)
+    :raises ValueError: Unknown match mode
+    """
+
+    if match not in matchModes:
+        raise ValueError(f"match must be one of {', '.join(matchModes)}")
+    if match == "exact":
+        return sql.SQL("{} = %s").format(identifier(column)), [value]
+
+    target = sql.SQL("{}" if column_type in textTypes else "{}::text").format(identifier(column))
+    pattern = escapeLike(value) + "%" if match == "prefix" else "%" + escapeLike(value) + "%"
+    return sql.SQL("{} LIKE %s").format(target), [pattern]
+
+
+def indexName(table_name: str, column_name: str, index_type: str) -> str:
+    """
+    :param table_name: Table name
+    :param column_name: Column name
+    :param index_type: Key of indexTypes
+    :return: Name of the index, names longer than the 63 bytes Postgres keeps end with a hash of the full name
+             so two long table/column pairs sharing their first 63 bytes don't get the same index
+    """
+
+    name = f"{table_name}_{column_name}_{index_type}_idx".lower()
+    if len(name.encode()) <= 63:
+        return name
+    digest = hashlib.blake2b(name.encode(), digest_size=4).hexdigest()
+    return name.encode()[:54].decode(errors="ignore") + "_" + digest
@@ -0,0 +1,135 @@
+import time
+import itertools
+import threading
+
+import psycopg2
+from limits.storage import storage_from_string
+from psycopg2.pool import PoolError
+from modules.classes.ConnectionPool import ConnectionPool
+# Registers the sharedmem:// storage the writes are recorded in
+from modules.security import SharedMemoryStorage
+
+
+class ReplicaPools:
+    """
+    Connection pools of the read replicas, reads are spread over them round-robin
+
+    Replicas are checked at most every check_interval seconds, one lagging more than max_lag seconds behind the primary
+    or failing to answer is skipped until its next check. A replica that has replayed the WAL position the primary
+    was at when the check started is up to date, otherwise its lag is the age of the last transaction it replayed.
+    choose() returns None when no replica is usable,
+    the caller reads from the primary instead.
+    Writes are recorded per client and per table: a client that wrote in the last stickiness seconds reads from the primary
+    so it sees its own writes, and recentlyWritten() tells the caches not to keep what a replica returned for a table
+    that may not have replicated yet.
+    They are recorded as expiring counters in a flask-limiter storage, the default sharedmem:// file is shared by every
+    worker process on the host, so a write handled by one gunicorn worker makes the client sticky in all of them.
+    memory:// keeps them per process, redis:// shares them between hosts
+
+    choose: Next usable replica pool, or None
+    failed: Skip a replica until its next check, called when one of its connections broke
+    wrote: Record a committed write of a client to a table
+    sticky: The client wrote in the last stickiness seconds
+    recentlyWritten: The table was written in the last max_lag seconds
+
+    :param dsns: libpq connection strings of the replicas
+    :param maxconn: Upper bound of connections open at the same time, per replica
+    :param primary: ConnectionPool of the primary, whose current WAL position the replicas are compared to
+    :param max_lag: Seconds of replication lag tolerated
+    :param check_interval: Seconds a lag check is trusted
+    :param stickiness: Seconds a client reads from the primary after a write
+    :param storage_uri: flask-limiter storage the writes are recorded in, ex: sharedmem:///tmp/flaskapi-replicas
+    :param kwargs: ConnectionPool arguments (timeout, ping_after) and psycopg2.connect arguments
+    """
+
+    # Seconds since the last replayed transaction, 0 when the replica has replayed up to the primary's position or isn't
+    # a standby at all. Comparing the replica with itself (receive = replay LSN) would also say 0 for a replica whose WAL
+    # receiver is disconnected. Unknown when nothing has been replayed yet, or the primary's position couldn't be read
+    lagQuery = ("SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_replay_lsn() >= %s::pg_lsn THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity') END")
+
+    def __init__(self, dsns: list, maxconn: int, primary: ConnectionPool = None, max_lag: float = 5, check_interval: float = 1,
+                 stickiness: float = 5, storage_uri: str = "memory://", **kwargs):
+        # No connection is opened up front, a replica that is down at startup doesn't stop the API
+        self.pools = [ConnectionPool(0, maxconn, dsn=dsn, **kwargs) for dsn in dsns]
+        self.primary = primary
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.stickiness = stickiness
+        self.lock = threading.Lock()
+        self.turn = itertools.count()
+        # pool: (usable, time.monotonic() of the check)
+        self.checks = {}
+        self.writes = storage_from_string(storage_uri)
+
+    def primaryLsn(self):
+        """
+        :return: Current WAL position of the primary, None if there is no primary pool or it can't be reached
+        """
+
+        if self.primary is None:
+            return None
+        try:
+            with self.primary.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_current_wal_lsn()")
+                    lsn = cur.fetchone()[0]
+                conn.rollback()
+            return lsn
+        except (psycopg2.Error, PoolError):
+            return None
+
+    def usable(self, pool: ConnectionPool) -> bool:
+        usable, checkedAt = self.checks.get(pool, (True, None))
+        if checkedAt is not None and time.monotonic() - checkedAt < self.check_interval:
+            return usable
+
+        # Read before the replica's, a replica that has replayed this far was up to date when the check started
+        lsn = self.primaryLsn()
+        try:
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(self.lagQuery, (lsn,))
+                    lag = float(cur.fetchone()[0])
+                conn.rollback()
+            usable = lag <= self.max_lag
+        except (psycopg2.Error, PoolError):
+            usable = False
+        self.checks[pool] = (usable, time.monotonic())
+        return usable
+
+    def choose(self):
+        """
+        :return: ConnectionPool of the next usable replica in round-robin order, None if none is usable
+        """
+
+        start = next(self.turn)
+        for offset in range(len(self.pools)):
+            pool = self.pools[(start + offset) % len(self.pools)]
+            if self.usable(pool):
+                return pool
+        return None
+
+    def failed(self, pool: ConnectionPool) -> None:
+        self.checks[pool] = (False, time.monotonic())
+
+    def wrote(self, client: str, table_name: str) -> None:
+        """
+        :param client: Key of the client that wrote, see rateLimitKey(), None outside a request
+        :param table_name: Table written, "*" for a schema change
+        """
+
+        # Each write restarts the window, expired counters free their slot
+        if client is not None:
+            self.writes.incr(f"replicas:client:{client}", self.stickiness, elastic_expiry=True)
+        self.writes.incr(f"replicas:table:{table_name}", self.max_lag, elastic_expiry=True)
+
+    def sticky(self, client: str) -> bool:
+        return self.writes.get(f"replicas:client:{client}") > 0
+
+    def recentlyWritten(self, table_name: str) -> bool:
+        return self.writes.get(f"replicas:table:{table_name}") > 0
+
+    def closeall(self) -> None:
+        for pool in self.pools:
+            pool.closeall()
@@ -0,0 +1,159 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from limits.storage import storage_from_string
+# Registers the sharedmem:// storage the table versions are kept in
+from modules.security import SharedMemoryStorage
+
+
+class CachedResponse:
+    """
+    Serialised body of a read response with its strong ETag
+
+    :param body: JSON body
+    :param version: Version of the table the body was read from
+    :param expires: time.monotonic() after which the entry is not served
+    """
+
+    __slots__ = ("body", "etag", "version", "expires")
+
+    def __init__(self, body: bytes, version: int, expires: float):
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.version = version
+        self.expires = expires
+
+
+class Flight:
+    """
+    Read of a response in progress, identical requests arriving meanwhile wait for its entry instead of querying the database
+
+    entry: CachedResponse of the read, None if it failed or returned something that can't be shared (error, stream)
+    """
+
+    __slots__ = ("table_name", "done", "entry")
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.done = threading.Event()
+        self.entry = None
+
+    def wait(self):
+        """
+        :return: CachedResponse of the read, None if there is nothing to share
+        """
+
+        self.done.wait()
+        return self.entry
+
+
+class ResponseCache:
+    """
+    LRU cache of serialised read responses, bounded by the total size of the cached bodies
+
+    Every table has a version that the write functions bump (see FlaskAPI.tableModified),
+    an entry is only served while the table is still at the version it was read from.
+    "*" is the version of the table list, bumped when tables are created or deleted.
+
+    Entries live in the process, versions are counters in a flask-limiter storage: the default sharedmem:// file is shared
+    by every worker process on the host, so a write made through one worker invalidates the entries of all of them.
+    A version counter expires 2 * ttl seconds after the last write of its table and starts again from 0,
+    by then every entry read at an earlier version has expired too
+
+    Misses are single-flight: the first request for a key and version reads it, identical requests arriving
+    while it runs join its Flight and share its body, so a burst costs one query per distinct request.
+    A write detaches the flights of its table, later requests start a new read of the new version
+
+    version: Current version of a table
+    bump: Invalidate every cached response of a table
+    get: Cached response for a key, None if missing, stale or expired
+    set: Cache a body
+    join: Flight of a key, started by the caller if there is none
+    land: End a flight with its entry
+
+    :param maxbytes: Upper bound of the total size of the cached bodies
+    :param ttl: Seconds an entry is served
+    :param storage_uri: flask-limiter storage of the table versions, ex: sharedmem:///tmp/flaskapi-versions, memory:// for one process
+    """
+
+    def __init__(self, maxbytes: int = 64 * 1024 * 1024, ttl: float = 60, storage_uri: str = "memory://"):
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.versions = storage_from_string(storage_uri)
+        self.flights = {}
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def version(self, table_name: str) -> int:
+        return self.versions.get(f"responses:version:{table_name}")
+
+    def bump(self, table_name: str) -> None:
+        self.versions.incr(f"responses:version:{table_name}", 2 * self.ttl, elastic_expiry=True)
+        with self.lock:
+            for key in [key for key, flight in self.flights.items() if flight.table_name == table_name]:
+                del self.flights[key]
+
+    def get(self, key: tuple, version: int):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != version or entry.expires < time.monotonic():
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key: tuple, version: int, body: bytes) -> CachedResponse:
+        entry = CachedResponse(body, version, time.monotonic() + self.ttl)
+        if len(body) > self.maxbytes:
+            return entry
+
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = entry
+            self.size += len(body)
+            while self.size > self.maxbytes:
+                self.remove(next(iter(self.entries)))
+        return entry
+
+    def join(self, key: tuple, version: int, table_name: str) -> tuple:
+        """
+        :param key: Cache key
+        :param version: Version of the table the request reads
+        :param table_name: Table read, its writes detach the flight
+        :return: (Flight, True if the caller started it and must land() it)
+        """
+
+        with self.lock:
+            flight = self.flights.get((key, version))
+            if flight is not None:
+                return flight, False
+            flight = self.flights[(key, version)] = Flight(table_name)
+            return flight, True
+
+    def land(self, key: tuple, version: int, flight: Flight, entry) -> None:
+        """
+        :param key: Cache key
+        :param version: Version of the flight
+        :param flight: Flight started by join()
+        :param entry: CachedResponse to share, None if the read can't be shared
+        """
+
+        flight.entry = entry
+        with self.lock:
+            if self.flights.get((key, version)) is flight:
+                del self.flights[(key, version)]
+        flight.done.set()
+
+    def remove(self, key: tuple) -> None:
+        """
+        Caller holds the lock
+        """
+
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.body)
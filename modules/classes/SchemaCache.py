@@ -0,0 +1,68 @@
+import time
+import threading
+
+
+class SchemaCache:
+    """
+    In-process copy of the public schema catalog: table names and their columns (name, order, type)
+    The whole catalog is loaded with two queries and kept until a DDL endpoint invalidates it,
+    or ttl seconds pass to pick up changes made outside the API
+
+    getTables: All tables in the public schema
+    getColumns: Columns of a table ordered by column_order, None if the table does not exist
+    invalidate: Drop the cached catalog, the next lookup reloads it
+    version: Incremented by every invalidation, lets other caches key on the schema they were built against
+
+    :param ttl: Seconds the catalog is trusted
+    """
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.catalog = None
+        self.expires = 0
+        self.version = 0
+
+    def load(self, cur) -> tuple:
+        """
+        Reload the catalog if it was invalidated or has expired
+
+        :param cur: Database cursor
+        :return: (tables, columns) snapshot of the catalog
+        """
+
+        catalog = self.catalog
+        if catalog is not None and time.monotonic() < self.expires:
+            return catalog
+
+        with self.lock:
+            if self.catalog is not None and time.monotonic() < self.expires:
+                return self.catalog
+
+            cur.execute("SELECT table_schema, table_name, table_type FROM information_schema.tables WHERE table_schema = 'public'")
+            tables = [{"table_schema": table[0], "table_name": table[1], "table_type": table[2]} for table in cur.fetchall()]
+
+            cur.execute("SELECT table_name, column_name, ordinal_position, data_type FROM information_schema.columns "
+                        "WHERE table_schema = 'public' ORDER BY table_name, ordinal_position")
+            columns = {table["table_name"]: [] for table in tables}
+            for column in cur.fetchall():
+                columns.setdefault(column[0], []).append({"column_name": column[1], "column_order": column[2], "column_type": column[3]})
+
+            self.catalog = (tables, columns)
+            self.expires = time.monotonic() + self.ttl
+            return self.catalog
+
+    def getTables(self, cur) -> list:
+        return self.load(cur)[0]
+
+    def getColumns(self, cur, table_name: str):
+        return self.load(cur)[1].get(table_name)
+
+    def invalidate(self, table_name: str = None) -> None:
+        """
+        :param table_name: Table that changed, the whole catalog is dropped either way since create/drop changes the table list
+        """
+
+        with self.lock:
+            self.catalog = None
+            self.version += 1
@@ -0,0 +1,176 @@
+import re
+import time
+import random
+import threading
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from flask import has_request_context
+from flask import request
+
+import config
+
+
+# Literals inlined in the text (ex: COPY of a mogrified query), bound parameters are never part of it
+literalPattern = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+executePattern = re.compile(r"^\s*EXECUTE\s+\"?(\w+)\"?", re.IGNORECASE)
+
+
+def redact(text: str) -> str:
+    """
+    :param text: SQL text with %s placeholders
+    :return: Text with quoted and numeric literals replaced by ?
+    """
+
+    return literalPattern.sub("?", text)
+
+
+def redactPlan(plan):
+    """
+    :param plan: EXPLAIN (FORMAT JSON) plan or any value in it
+    :return: Copy of the plan with every string redacted, conditions (Filter, Index Cond, Recheck Cond, Join Filter ...),
+             outputs and sort keys hold the parameter values the statement ran with
+    """
+
+    if isinstance(plan, str):
+        return redact(plan)
+    if isinstance(plan, dict):
+        return {key: redactPlan(value) for key, value in plan.items()}
+    if isinstance(plan, list):
+        return [redactPlan(value) for value in plan]
+    return plan
+
+
+def statementText(cursor, text: str) -> str:
+    """
+    :param cursor: Cursor the statement ran on
+    :param text: SQL text sent, EXECUTE of a prepared statement or the query itself
+    :return: Text of the query a prepared statement was prepared from, text otherwise
+    """
+
+    match = executePattern.match(text)
+    prepared = getattr(cursor.connection, "preparedStatements", None)
+    if match and prepared:
+        for (query, _), name in list(prepared.items()):
+            if name == match.group(1):
+                return query
+    return text
+
+
+def seqScans(plan: dict) -> list:
+    """
+    :param plan: Node of an EXPLAIN (FORMAT JSON) plan
+    :return: [{"table": name, "rows": rows read, "large": rows >= config.SLOW_QUERY_SEQ_SCAN_ROWS}] of every Seq Scan under the node
+    """
+
+    scans = []
+    if plan.get("Node Type") == "Seq Scan":
+        rows = (plan.get("Actual Rows", 0) + plan.get("Rows Removed by Filter", 0)) * plan.get("Actual Loops", 1)
+        scans.append({"table": plan.get("Relation Name"), "rows": rows, "large": rows >= config.SLOW_QUERY_SEQ_SCAN_ROWS})
+    for child in plan.get("Plans", []):
+        scans.extend(seqScans(child))
+    return scans
+
+
+class SlowQueryLog:
+    """
+    Ring buffer of the last config.SLOW_QUERY_LOG_SIZE statements that took config.SLOW_QUERY_THRESHOLD seconds or more,
+    fed by InstrumentedCursor and served on /api/v1/slow-queries
+
+    Entries hold the redacted SQL text, its duration, rows and the endpoint it ran for, plans are redacted the same way.
+    SELECTs are explained with EXPLAIN (ANALYZE, BUFFERS), which runs the query a second time, so only a sample of
+    config.SLOW_QUERY_EXPLAIN_SAMPLE of them is explained and at most one every config.SLOW_QUERY_EXPLAIN_INTERVAL seconds.
+    Sequential scans of the plan are listed with the rows they read, large ones are flagged
+
+    record: Log a statement if it was slow
+    entries: Logged statements, newest first
+    recorded: Slow statements seen since startup, including the ones the buffer dropped
+    explained: Plans captured since startup
+    """
+
+    def __init__(self):
+        self.buffer = deque(maxlen=config.SLOW_QUERY_LOG_SIZE)
+        self.lock = threading.Lock()
+        self.recorded = 0
+        self.explained = 0
+        self.lastExplain = 0.0
+
+    def shouldExplain(self, text: str) -> bool:
+        # EXPLAIN ANALYZE executes the statement, anything but a SELECT would be applied twice
+        if not text.lstrip().upper().startswith("SELECT") or random.random() >= config.SLOW_QUERY_EXPLAIN_SAMPLE:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if now - self.lastExplain < config.SLOW_QUERY_EXPLAIN_INTERVAL:
+                return False
+            self.lastExplain = now
+            return True
+
+    def explain(self, cursor, text: str, vars) -> dict:
+        """
+        Run EXPLAIN (ANALYZE, BUFFERS) of the statement in a savepoint on a second cursor,
+        the results of the cursor and the transaction are left as they were
+
+        :param cursor: Cursor the statement ran on
+        :param text: SQL text sent
+        :param vars: Parameters of the statement
+        :return: Top node of the JSON plan, None if it could not be captured
+        """
+
+        conn = cursor.connection
+        if conn.autocommit or conn.info.transaction_status != extensions.TRANSACTION_STATUS_INTRANS:
+            return None
+        # A plain cursor, the EXPLAIN itself is not timed or logged
+        with conn.cursor(cursor_factory=extensions.cursor) as explainCursor:
+            try:
+                explainCursor.execute("SAVEPOINT flaskapi_explain")
+                explainCursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + text, vars)
+                plan = explainCursor.fetchone()[0][0]
+                explainCursor.execute("RELEASE SAVEPOINT flaskapi_explain")
+                return plan
+            except psycopg2.Error:
+                explainCursor.execute("ROLLBACK TO SAVEPOINT flaskapi_explain")
+                return None
+
+    def record(self, cursor, query, vars, duration: float, rows: int) -> None:
+        """
+        :param cursor: Cursor the statement ran on
+        :param query: Statement as passed to execute, str or sql.Composable
+        :param vars: Parameters of the statement, never logged
+        :param duration: Seconds the statement took
+        :param rows: Rows returned or affected
+        """
+
+        if config.SLOW_QUERY_THRESHOLD <= 0 or duration < config.SLOW_QUERY_THRESHOLD:
+            return
+
+        text = query if isinstance(query, str) else query.as_string(cursor.connection)
+        statement = statementText(cursor, text)
+        entry = {
+            "time": time.time(),
+            "endpoint": request.endpoint if has_request_context() else None,
+            "query": redact(statement),
+            "duration": duration,
+            "rows": rows,
+            "plan": None,
+            "seq_scans": [],
+        }
+        if self.shouldExplain(statement):
+            plan = self.explain(cursor, text, vars)
+            if plan is not None:
+                entry["plan"] = redactPlan(plan)
+                entry["seq_scans"] = seqScans(plan["Plan"])
+                with self.lock:
+                    self.explained += 1
+
+        with self.lock:
+            self.recorded += 1
+            self.buffer.append(entry)
+
+    def entries(self) -> list:
+        with self.lock:
+            return list(reversed(self.buffer))
+
+
+slowQueries = SlowQueryLog()
@@ -17,8 +17,9 @@ class SuccessMessage:
         """
 
         # Set default values for extra data not used in the specific success message
-        self.data = data
-        self.data.update({x: y for list_item in [{variable: ""} for variable in ['table_name', 'column_name', 'new_column_name', 'new_column_type', 'data'] if variable not in data] for (x, y) in list_item.items()})
+        # Kept local, the instance is shared by every request thread
+        data = dict(data)
+        data.update({x: y for list_item in [{variable: ""} for variable in ['table_name', 'column_name', 'new_column_name', 'new_column_type', 'data'] if variable not in data] for (x, y) in list_item.items()})
 
         """
          These 4 lines are the simplified version of line 15
@@ -31,15 +32,22 @@ class SuccessMessage:
         """
 
         successMessages = {
-            "create_table": {"status": self.status, "success": f"Table created successfully: {self.data['table_name']}"},
-            "delete_table": {"status": self.status, "success": f"Table deleted successfully: {self.data['table_name']}"},
-            "create_column": {"status": self.status, "success": f"Column: {self.data['column_name']} created in table: {self.data['table_name']} successfully"},
-            "delete_column": {"status": self.status, "success": f"Column: {self.data['column_name']} deleted in table: {self.data['table_name']} successfully"},
-            "update_column_name": {"status": self.status, "success": f"Column: {self.data['column_name']} updated name to: {self.data['new_column_name']} in table: {self.data['table_name']}"},
-            "update_column_type": {"status": self.status, "success": f"Column: {self.data['column_name']} updated type to: {self.data['new_column_type']} in table: {self.data['table_name']}"},
-            "insert_row": {"status": self.status, "success": f"Row inserted successfully in table: {self.data['table_name']}", "data": self.data['data']},
-            "update_row": {"status": self.status, "success": f"Row updated successfully in table: {self.data['table_name']}", "data": self.data['data']},
-            "delete_row": {"status": self.status, "success": f"Row deleted successfully in table: {data['table_name']}", "data": self.data['data']},
-            "select_row": {"status": self.status, "success": f"Row selected successfully in table: {self.data['table_name']}", "data": self.data['data']}
+            "create_table": {"status": self.status, "success": f"Table created successfully: {data['table_name']}"},
+            "delete_table": {"status": self.status, "success": f"Table deleted successfully: {data['table_name']}"},
+            "create_column": {"status": self.status, "success": f"Column: {data['column_name']} created in table: {data['table_name']} successfully"},
+            "delete_column": {"status": self.status, "success": f"Column: {data['column_name']} deleted in table: {data['table_name']} successfully"},
+            "update_column_name": {"status": self.status, "success": f"Column: {data['column_name']} updated name to: {data['new_column_name']} in table: {data['table_name']}"},
+            "update_column_type": {"status": self.status, "success": f"Column: {data['column_name']} updated type to: {data['new_column_type']} in table: {data['table_name']}"},
+            "create_index": {"status": self.status, "success": f"Index created on column: {data['column_name']} in table: {data['table_name']}", "data": data['data']},
+            "delete_index": {"status": self.status, "success": f"Index deleted on column: {data['column_name']} in table: {data['table_name']}", "data": data['data']},
+            "insert_row": {"status": self.status, "success": f"Row inserted successfully in table: {data['table_name']}", "data": data['data']},
+            "insert_rows": {"status": self.status, "success": f"Rows inserted successfully in table: {data['table_name']}", "data": data['data']},
+            "import_rows": {"status": self.status, "success": f"Rows imported into table: {data['table_name']}", "data": data['data']},
+            "update_row": {"status": self.status, "success": f"Row updated successfully in table: {data['table_name']}", "data": data['data']},
+            "update_rows": {"status": self.status, "success": f"Rows updated successfully in table: {data['table_name']}", "data": data['data']},
+            "delete_rows": {"status": self.status, "success": f"Rows deleted successfully in table: {data['table_name']}", "data": data['data']},
+            "delete_row": {"status": self.status, "success": f"Row deleted successfully in table: {data['table_name']}", "data": data['data']},
+            "select_row": {"status": self.status, "success": f"Row selected successfully in table: {data['table_name']}", "data": data['data']},
+            "batch": {"status": self.status, "success": "Batch committed successfully", "data": data['data']}
         }
         return successMessages[attr]
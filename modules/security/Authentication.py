@@ -1,32 +1,123 @@
-import os
 import hashlib
+import config
+from typing import Callable
 from flask import jsonify
+from modules.classes.Metrics import metrics
+from modules.security.KeyStore import EnvironmentKeyStore
+from modules.SyntaxSugar.decorators import countError
+from modules.security.KeyStore import VerifiedKeyCache
 
 
+@countError
 def invalidAPIKeyError() -> jsonify:
     return {"status": 500, "error": "Invalid API key"}
 
 
+def requireAPIKey(func: Callable) -> Callable:
+    """
+    Mark a method as a protected operation
+    Must be the outermost decorator, the auth wrapper is built once when the class is created (see Authentication.__init_subclass__)
+
+    :param func: function
+    """
+
+    func.requiresAPIKey = True
+    return func
+
+
+def authenticate(func: Callable) -> Callable:
+    """
+    Build the wrapper checking the API key before executing a protected operation
+
+    :param func: function
+    """
+
+    def wrapper(self, *args, **kwargs):
+        """
+        :param self: Authentication
+        :param args: args[0] is the API key passed from the user
+        :param kwargs: kwargs['api_key'] is the API key passed from the user
+        :return: dict
+        """
+        api_key = kwargs['api_key'] if 'api_key' in kwargs else (args[0] if args else None)
+        if self.check_api_key(api_key=api_key):
+            return func(self, *args, **kwargs)
+        return invalidAPIKeyError()
+
+    wrapper.__doc__ = func.__doc__
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
 class Authentication:
     """
     The user will be authenticated by providing an API key.
 
     Each API key should be unique to each user.
-    The API keys should be stored in a separate database.
-    For the sake of this project, I will be using a static API key.
+    Keys are looked up by their SHA-256 digest in a key store (environment variable, file or database, see KeyStore.py).
+    Keys already checked are cached so most requests need neither a key store lookup nor a hash.
+
+    keyStore: Where valid key digests are stored
+    verifiedKeys: Cache of valid keys, verifiedKeys.hits and verifiedKeys.misses count cache use
+    rejectedKeys: Cache of invalid keys, kept apart and short lived so random keys can't evict the valid ones
+    renderKeyCaches: Hits and misses of both caches in Prometheus text format, served on /metrics
+
+    operations: Registry of protected operations {name: unwrapped function}, built once per subclass
     """
 
-    def __init__(self):
-        self.saved_api_token = os.environ.get("API_KEY")
+    operations = {}
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        Replace every method marked with @requireAPIKey by its auth wrapper when the class is created,
+        so dispatch costs one extra call per request and plain attribute lookups cost nothing extra
+        """
+
+        super().__init_subclass__(**kwargs)
+        cls.operations = dict(cls.operations)
+        for name, func in list(vars(cls).items()):
+            if getattr(func, 'requiresAPIKey', False):
+                cls.operations[name] = func
+                wrapper = authenticate(func)
+                wrapper.__name__ = name
+                setattr(cls, name, wrapper)
+
+    def __init__(self, keyStore=None):
+        self.keyStore = keyStore or EnvironmentKeyStore()
+        self.verifiedKeys = VerifiedKeyCache(maxsize=config.API_KEY_CACHE_SIZE, ttl=config.API_KEY_CACHE_TTL)
+        self.rejectedKeys = VerifiedKeyCache(maxsize=config.API_KEY_REJECTED_CACHE_SIZE, ttl=config.API_KEY_REJECTED_CACHE_TTL)
         self.sha256_api_token_converted = lambda api_key: hashlib.sha256(api_key.encode()).hexdigest()
+        metrics.collect(self.renderKeyCaches)
 
     def check_api_key(self, api_key: str) -> bool:
         """
-        Table names are case seem to be set to all lower case base on my testing with requests specifically
-        Convert all keys in a dict to lowercase
+        Compare the hashed api key against the key store
+        Valid keys are cached in verifiedKeys, invalid ones in rejectedKeys so a client repeating a wrong key doesn't hit the key store
+        on every request, and a flood of distinct wrong keys only churns rejectedKeys
 
         :param api_key: api key to be checked
         :return: True if the api key is valid, False if the api key is invalid
         """
 
-        return self.saved_api_token == self.sha256_api_token_converted(api_key)
+        if not api_key:
+            return False
+
+        valid = self.verifiedKeys.get(api_key)
+        if valid is None:
+            valid = self.rejectedKeys.get(api_key)
+        if valid is None:
+            valid = self.keyStore.contains(self.sha256_api_token_converted(api_key))
+            (self.verifiedKeys if valid else self.rejectedKeys).set(api_key, valid)
+        return valid
+
+    def renderKeyCaches(self) -> list:
+        """
+        :return: Prometheus text lines of the verified and rejected key caches
+        """
+
+        lines = ["# HELP flaskapi_api_key_cache_total API key lookups answered by the key caches (hit) or sent to the key store (miss)",
+                 "# TYPE flaskapi_api_key_cache_total counter"]
+        for name, cache in (("verified", self.verifiedKeys), ("rejected", self.rejectedKeys)):
+            lines.append(f'flaskapi_api_key_cache_total{{cache="{name}",result="hit"}} {cache.hits}')
+            lines.append(f'flaskapi_api_key_cache_total{{cache="{name}",result="miss"}} {cache.misses}')
+        return lines
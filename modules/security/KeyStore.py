@@ -0,0 +1,162 @@
+import os
+import hmac
+import time
+import threading
+from collections import OrderedDict
+
+import config
+
+
+class EnvironmentKeyStore:
+    """
+    Single API key whose SHA-256 digest is stored in the API_KEY environment variable
+    """
+
+    def __init__(self):
+        self.digest = os.environ.get("API_KEY") or ""
+
+    def contains(self, digest: str) -> bool:
+        return bool(self.digest) and hmac.compare_digest(self.digest, digest)
+
+
+class FileKeyStore:
+    """
+    One SHA-256 digest per line, blank lines and lines starting with # are ignored
+    The file is reloaded when its modification time changes
+
+    :param path: Path to the key file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = None
+        self.digests = []
+        self.lock = threading.Lock()
+
+    def load(self) -> list:
+        mtime = os.stat(self.path).st_mtime
+        with self.lock:
+            if mtime != self.mtime:
+                with open(self.path, 'r') as file:
+                    self.digests = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+                self.mtime = mtime
+            return self.digests
+
+    def contains(self, digest: str) -> bool:
+        # Every digest is compared so the time taken does not depend on where a match is
+        found = False
+        for saved in self.load():
+            found |= hmac.compare_digest(saved, digest)
+        return found
+
+
+class DatabaseKeyStore:
+    """
+    Keys stored in flaskapi.api_keys, a schema of its own so the table is not listed or editable through get_tables
+    The table is created by the first lookup, the pool doesn't connect before a worker serves requests
+
+    :param pool: ConnectionPool
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.created = False
+
+    def create(self) -> None:
+        if self.created:
+            return
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE SCHEMA IF NOT EXISTS flaskapi")
+                cur.execute("CREATE TABLE IF NOT EXISTS flaskapi.api_keys ("
+                            "key_digest CHAR(64) PRIMARY KEY, "
+                            "client_name TEXT, "
+                            "revoked BOOLEAN NOT NULL DEFAULT FALSE, "
+                            "created_at TIMESTAMPTZ NOT NULL DEFAULT now())")
+            conn.commit()
+        self.created = True
+
+    def contains(self, digest: str) -> bool:
+        self.create()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT key_digest FROM flaskapi.api_keys WHERE key_digest = %s AND NOT revoked", (digest,))
+                row = cur.fetchone()
+            conn.rollback()
+        return row is not None and hmac.compare_digest(row[0], digest)
+
+
+def createKeyStore(pool) -> object:
+    """
+    Key store selected by API_KEY_STORE: env (default), file or database
+
+    :param pool: ConnectionPool used by the database key store
+    :return: Key store
+    """
+
+    if config.API_KEY_STORE == 'file':
+        return FileKeyStore(config.API_KEY_FILE)
+    if config.API_KEY_STORE == 'database':
+        return DatabaseKeyStore(pool)
+    return EnvironmentKeyStore()
+
+
+class VerifiedKeyCache:
+    """
+    LRU cache of API keys already checked against the key store
+    Entries expire after ttl seconds, so a revoked key stops working within ttl seconds
+
+    hits: Lookups answered from the cache
+    misses: Lookups that had to go to the key store
+
+    :param maxsize: Maximum number of cached keys
+    :param ttl: Seconds an entry is trusted
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, api_key: str):
+        """
+        :param api_key: Raw API key from the request header
+        :return: True/False if the key was checked within ttl seconds, None otherwise
+        """
+
+        with self.lock:
+            entry = self.entries.get(api_key)
+            if entry is None or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self.entries.move_to_end(api_key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, api_key: str):
+        """
+        get() without counting a hit or miss nor refreshing the key's place in the LRU order
+
+        :param api_key: Raw API key from the request header
+        :return: True/False if the key was checked within ttl seconds, None otherwise
+        """
+
+        with self.lock:
+            entry = self.entries.get(api_key)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            return entry[0]
+
+    def set(self, api_key: str, valid: bool) -> None:
+        with self.lock:
+            self.entries[api_key] = (valid, time.monotonic() + self.ttl)
+            self.entries.move_to_end(api_key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
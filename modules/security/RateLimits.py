@@ -0,0 +1,68 @@
+import hashlib
+from typing import Callable
+from flask import current_app
+from flask import g
+from flask import request
+from flask_limiter.util import get_remote_address
+import config
+
+
+def apiKeyDigest() -> str:
+    """
+    An API key is trusted as a limiter key only once the API has verified it (see Authentication.verifiedKeys),
+    otherwise a client could send a new random key with each request to get fresh limits and a key store lookup each time.
+    The first request of a valid key is counted against its remote address, later ones against the key.
+    Verification only peeks at the cache, so a rate limited request never reaches the key store
+
+    The digest is computed once per request and kept on flask.g
+
+    :return: SHA-256 of the API key of the current request, "" if there is none or it isn't verified yet
+    """
+
+    digest = g.get("apiKeyDigest")
+    if digest is not None:
+        return digest
+
+    api_key = request.headers.get('x-api-key')
+    api = current_app.extensions.get("flaskapi")
+    if not api_key or api is None or not api.verifiedKeys.peek(api_key):
+        # Not kept, the key may be verified later in the request (see FlaskAPI.tableModified())
+        return ""
+    g.apiKeyDigest = hashlib.sha256(api_key.encode()).hexdigest()
+    return g.apiKeyDigest
+
+
+def rateLimitKey() -> str:
+    """
+    Rate limits are counted per verified API key, other requests are counted per remote address.
+    Also the client key of replica stickiness, see FlaskAPI.poolFor()
+
+    :return: Limiter key of the current request
+    """
+
+    digest = apiKeyDigest()
+    return f"key:{digest[:32]}" if digest else f"ip:{get_remote_address()}"
+
+
+def routeLimit(route: str) -> Callable:
+    """
+    Limit provider for @limiter.limit, evaluated on every request
+
+    The limit is the first of
+    config.API_KEY_RATE_LIMITS[<sha256 of the api key>][route], config.API_KEY_RATE_LIMITS[<sha256 of the api key>]["default"],
+    config.RATE_LIMITS[route], config.RATE_LIMITS["default"]
+
+    :param route: Name of the route function
+    :return: Callable returning a limit string (ex: "1/second")
+    """
+
+    def limit() -> str:
+        keyLimits = config.API_KEY_RATE_LIMITS.get(apiKeyDigest()) if config.API_KEY_RATE_LIMITS else None
+        if keyLimits:
+            if route in keyLimits:
+                return keyLimits[route]
+            if "default" in keyLimits:
+                return keyLimits["default"]
+        return config.RATE_LIMITS.get(route, config.RATE_LIMITS.get("default", "1/second"))
+
+    return limit
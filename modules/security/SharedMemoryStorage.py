@@ -0,0 +1,147 @@
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from limits.storage import Storage
+
+
+class SharedMemoryStorage(Storage):
+    """
+    flask-limiter storage keeping rate limit counters in a memory-mapped file shared by every worker process on the host,
+    so a limit applies to the host and not once per gunicorn worker
+
+    Use it with storage_uri="sharedmem:///path/to/file?slots=65536&stripes=256"
+
+    The file is a hash table of fixed size slots (key hash, count, expiry).
+    Slots are split in stripes, a key only ever lives in its own stripe and each stripe has its own lock
+    (a threading.Lock for the threads of this process and an fcntl record lock for the other processes),
+    so requests for different keys rarely wait on each other.
+    Expired slots are reused, when a stripe is full the slot closest to expiry is evicted.
+
+    Counters are the fixed windows the flask-limiter strategies are built on: incr, get, get_expiry
+    """
+
+    STORAGE_SCHEME = ["sharedmem"]
+
+    slot = struct.Struct("<Qqd")
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        parsed = urlparse(uri)
+        query = dict(part.split("=", 1) for part in parsed.query.split("&") if "=" in part)
+        self.path = parsed.path or "/tmp/flaskapi-ratelimit"
+        self.slots = int(query.get("slots", options.get("slots", 65536)))
+        self.stripes = int(query.get("stripes", options.get("stripes", 256)))
+        self.stripe_size = self.slots // self.stripes
+        self.slots = self.stripe_size * self.stripes
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * self.slot.size
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.memory = mmap.mmap(self.fd, size)
+        self.locks = [threading.Lock() for _ in range(self.stripes)]
+        super(SharedMemoryStorage, self).__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    def keyHash(self, key: str) -> int:
+        # 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    @contextmanager
+    def lockStripe(self, stripe: int):
+        """
+        Hold the lock of one stripe across threads and processes
+        """
+
+        length = self.stripe_size * self.slot.size
+        with self.locks[stripe]:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, stripe * length)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, stripe * length)
+
+    def find(self, keyHash: int, now: float) -> tuple:
+        """
+        Slot of a key, the caller holds the stripe lock
+
+        :param keyHash: keyHash(key)
+        :param now: time.time()
+        :return: (offset of the slot, True if the slot holds a live counter for the key)
+        """
+
+        stripe = keyHash % self.stripes
+        start = (keyHash // self.stripes) % self.stripe_size
+        free = None
+        oldest = None
+        oldest_expiry = None
+        for probe in range(self.stripe_size):
+            offset = (stripe * self.stripe_size + (start + probe) % self.stripe_size) * self.slot.size
+            saved, _, expiry = self.slot.unpack_from(self.memory, offset)
+            if saved == keyHash:
+                return offset, expiry > now
+            if saved == 0:
+                return (free if free is not None else offset), False
+            if expiry <= now and free is None:
+                free = offset
+            if oldest_expiry is None or expiry < oldest_expiry:
+                oldest, oldest_expiry = offset, expiry
+        return (free if free is not None else oldest), False
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        keyHash = self.keyHash(key)
+        now = time.time()
+        with self.lockStripe(keyHash % self.stripes):
+            offset, live = self.find(keyHash, now)
+            if live:
+                _, count, expires = self.slot.unpack_from(self.memory, offset)
+                count += amount
+                if elastic_expiry:
+                    expires = now + expiry
+            else:
+                count, expires = amount, now + expiry
+            self.slot.pack_into(self.memory, offset, keyHash, count, expires)
+            return count
+
+    def get(self, key: str) -> int:
+        keyHash = self.keyHash(key)
+        with self.lockStripe(keyHash % self.stripes):
+            offset, live = self.find(keyHash, time.time())
+            return self.slot.unpack_from(self.memory, offset)[1] if live else 0
+
+    def get_expiry(self, key: str) -> int:
+        keyHash = self.keyHash(key)
+        now = time.time()
+        with self.lockStripe(keyHash % self.stripes):
+            offset, live = self.find(keyHash, now)
+            return int(self.slot.unpack_from(self.memory, offset)[2] if live else now)
+
+    def clear(self, key: str) -> None:
+        keyHash = self.keyHash(key)
+        with self.lockStripe(keyHash % self.stripes):
+            offset, live = self.find(keyHash, time.time())
+            if live:
+                # Keep the hash so probing still walks past this slot, an expired slot is free for reuse
+                self.slot.pack_into(self.memory, offset, keyHash, 0, 0)
+
+    def check(self) -> bool:
+        return not self.memory.closed
+
+    def reset(self) -> int:
+        cleared = 0
+        for stripe in range(self.stripes):
+            with self.lockStripe(stripe):
+                for index in range(stripe * self.stripe_size, (stripe + 1) * self.stripe_size):
+                    if self.slot.unpack_from(self.memory, index * self.slot.size)[0]:
+                        cleared += 1
+                        self.slot.pack_into(self.memory, index * self.slot.size, 0, 0, 0)
+        return cleared
@@ -0,0 +1,484 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+import psycopg2
+import requests
+
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    :param values: Sorted values
+    :param p: Percentile between 0 and 100
+    :return: Linearly interpolated percentile, 0 for no values
+    """
+
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def processTreeRSS(pid: int) -> int:
+    """
+    Resident memory of a process and its children in bytes, read from /proc (Linux only, 0 elsewhere)
+
+    :param pid: Process id
+    :return: Bytes
+    """
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            with open(f"/proc/{current}/task/{current}/children") as children:
+                pending.extend(int(child) for child in children.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class throwawayPostgres:
+    """
+    Postgres cluster created with initdb in a temporary directory and removed on stop
+    initdb refuses to run as root, run the benchmark as a regular user or pass --external
+
+    env: POSTGRES_* variables pointing at the cluster
+    """
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="flaskapi-load-test-")
+        self.data = os.path.join(self.directory, "data")
+        self.port = freePort()
+        self.env = {
+            "POSTGRES_DB": "postgres",
+            "POSTGRES_USER": "postgres",
+            "POSTGRES_PASSWORD": "",
+            "POSTGRES_HOST": self.directory,
+            "POSTGRES_PORT": str(self.port),
+        }
+
+    def start(self):
+        subprocess.run(["initdb", "-D", self.data, "-U", "postgres", "--auth=trust", "-E", "UTF8"], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(["pg_ctl", "-D", self.data, "-l", os.path.join(self.directory, "postgres.log"), "-w",
+                        "-o", f"-p {self.port} -k {self.directory} -c listen_addresses=''", "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+
+    def stop(self):
+        subprocess.run(["pg_ctl", "-D", self.data, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class benchmarkLoad:
+    """
+    Load test of every route against a seeded database
+    Starts a throwaway Postgres (initdb/pg_ctl on PATH) or uses the POSTGRES_* environment variables with --external,
+    starts the app in a subprocess and drives it with concurrent clients.
+    Each scenario reports p50/p95/p99 latency per route, throughput and the resident memory of the app process,
+    results are written as JSON and can be compared with a previous run
+
+    Scenarios:
+    get_rows_large: Page through the seeded table and stream it whole
+    bulk_insert: insert_rows batches into an empty table
+    mixed: 80% reads (select_row, get_rows, get_columns, get_tables), 20% writes (insert_row, update_row, update_rows)
+    every_route: Each client runs every route on its own table, DDL included
+    herd: Every client but one reads the same page while the last one keeps writing to the table,
+          each write sends the readers to the database at once. db_calls shows the get_rows calls that reached it
+
+    Run from the repository root: python -m tests.benchmarks.load_test --rows 100000 --concurrency 16 --duration 30
+    """
+
+    scenarios = ["get_rows_large", "bulk_insert", "mixed", "every_route", "herd"]
+
+    def __init__(self, rows: int, concurrency: int, duration: float, batch_size: int, page_size: int, external: bool):
+        self.rows = rows
+        self.concurrency = concurrency
+        self.duration = duration
+        self.batch_size = batch_size
+        self.page_size = page_size
+        self.database = None if external else throwawayPostgres()
+        self.api_key = "load-test"
+        self.port = freePort()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.headers = {"x-api-key": self.api_key}
+        self.table = "load_test_rows"
+        self.insert_table = "load_test_inserts"
+        self.server = None
+
+    # *** Setup ***
+
+    def databaseEnv(self) -> dict:
+        if self.database is not None:
+            return self.database.env
+        return {key: value for key, value in os.environ.items() if key.startswith("POSTGRES_")}
+
+    def startApp(self):
+        env = dict(os.environ, **self.databaseEnv())
+        env.update({
+            "API_KEY_STORE": "env",
+            "API_KEY": hashlib.sha256(self.api_key.encode()).hexdigest(),
+            "RATELIMIT_ENABLED": "false",
+            "RATELIMIT_STORAGE_URI": "memory://",
+            "POSTGRES_POOL_MAX": str(max(10, self.concurrency)),
+        })
+        command = f"import app; app.create_app().run(host='127.0.0.1', port={self.port}, threaded=True, debug=False)"
+        self.server = subprocess.Popen([sys.executable, "-c", command], cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if requests.get(f"{self.url}/metrics", timeout=1).status_code == 200:
+                    return
+            except requests.ConnectionError:
+                pass
+            if self.server.poll() is not None:
+                break
+            time.sleep(0.2)
+        raise RuntimeError("The app did not start, run it by hand with the same environment to see the error")
+
+    def post(self, session: requests.Session, path: str, data=None, **kwargs) -> requests.Response:
+        return session.post(f"{self.url}{path}", headers=self.headers, json=data, **kwargs)
+
+    def createTable(self, session: requests.Session, table_name: str):
+        self.post(session, "/api/v1/delete-table", {"table_name": table_name})
+        self.post(session, "/api/v1/create-table", {"table_name": table_name})
+        for column, column_type in [("pokemon_number", "integer"), ("pokemon_name", "text"), ("notes", "text")]:
+            self.post(session, "/api/v1/create-column", {"table_name": table_name, "column_name": column, "column_type": column_type})
+
+    def seed(self):
+        """
+        Tables are created through the API, the rows are generated by the database so seeding a million rows takes seconds
+        """
+
+        with requests.Session() as session:
+            self.createTable(session, self.table)
+            self.createTable(session, self.insert_table)
+
+        env = self.databaseEnv()
+        conn = psycopg2.connect(database=env.get("POSTGRES_DB"), user=env.get("POSTGRES_USER"), password=env.get("POSTGRES_PASSWORD"),
+                                host=env.get("POSTGRES_HOST"), port=env.get("POSTGRES_PORT"))
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"INSERT INTO {self.table} (pokemon_number, pokemon_name, notes) "
+                            "SELECT i, 'pokemon' || i, md5(i::text) FROM generate_series(1, %s) AS i", [self.rows])
+                conn.commit()
+                conn.autocommit = True
+                cur.execute(f"ANALYZE {self.table}")
+        finally:
+            conn.close()
+
+    def tearDown(self):
+        if self.server is not None:
+            try:
+                with requests.Session() as session:
+                    for table_name in [self.table, self.insert_table]:
+                        self.post(session, "/api/v1/delete-table", {"table_name": table_name})
+            except requests.RequestException:
+                pass
+            self.server.terminate()
+            self.server.wait(timeout=10)
+        if self.database is not None:
+            self.database.stop()
+
+    # *** Scenarios, one step of one client returning [(route, seconds, ok)] ***
+
+    def timed(self, route: str, call) -> tuple:
+        start = time.perf_counter()
+        try:
+            response = call()
+            ok = response.status_code in (200, 304)
+            if ok and response.headers.get("Content-Type", "").startswith("application/json") and b'"error"' in response.content[:200]:
+                ok = False
+        except requests.RequestException:
+            ok = False
+        return route, time.perf_counter() - start, ok
+
+    def get_rows_large(self, session: requests.Session, state: dict) -> list:
+        results = []
+        after = None
+        while True:
+            data = {"table_name": self.table, "limit": self.page_size}
+            if after:
+                data["after"] = after
+            response = {}
+
+            def call():
+                page = self.post(session, "/api/v1/rows", data)
+                response.update(page.json() if page.status_code == 200 else {})
+                return page
+
+            results.append(self.timed("get_rows (page)", call))
+            after = response.get("next")
+            if not after or time.monotonic() > state["deadline"]:
+                break
+        results.append(self.timed("get_rows (stream)", lambda: self.post(session, "/api/v1/rows", {"table_name": self.table, "stream": "ndjson"})))
+        return results
+
+    def bulk_insert(self, session: requests.Session, state: dict) -> list:
+        rows = [{"pokemon_number": i, "pokemon_name": f"bulk{i}", "notes": "load test"} for i in range(self.batch_size)]
+        return [self.timed("insert_rows", lambda: self.post(session, "/api/v1/insert-rows", {"table_name": self.insert_table, "rows": rows}))]
+
+    def mixed(self, session: requests.Session, state: dict) -> list:
+        row_id = random.randint(1, max(self.rows, 1))
+        choice = random.random()
+        if choice < 0.3:
+            return [self.timed("select_row", lambda: self.post(session, "/api/v1/select-row", {
+                "table_name": self.table, "column_name": "pokemon_name", "column_value": f"pokemon{row_id}", "match": "exact"}))]
+        if choice < 0.6:
+            return [self.timed("get_rows (page)", lambda: self.post(session, "/api/v1/rows", {"table_name": self.table, "limit": self.page_size}))]
+        if choice < 0.7:
+            return [self.timed("get_columns", lambda: self.post(session, "/api/v1/columns", {"table_name": self.table}))]
+        if choice < 0.8:
+            return [self.timed("get_tables", lambda: session.get(f"{self.url}/api/v1/tables", headers=self.headers))]
+        if choice < 0.9:
+            return [self.timed("insert_row", lambda: self.post(session, "/api/v1/insert-row", {
+                "table_name": self.table, "row_data": {"pokemon_number": row_id, "pokemon_name": f"mixed{row_id}", "notes": "load test"}}))]
+        if choice < 0.97:
+            return [self.timed("update_row", lambda: self.post(session, "/api/v1/update-row", {
+                "table_name": self.table, "row_id": row_id, "new_row_data": {"notes": f"updated {time.time()}"}}))]
+        return [self.timed("update_rows", lambda: self.post(session, "/api/v1/update-rows", {
+            "table_name": self.table, "row_ids": [row_id, row_id + 1, row_id + 2], "new_row_data": {"notes": "bulk updated"}}))]
+
+    def every_route(self, session: requests.Session, state: dict) -> list:
+        table = {"table_name": f"load_test_client_{state['client']}"}
+        csv = "pokemon_number,pokemon_name,notes\n" + "".join(f"{i},imported{i},load test\n" for i in range(100))
+        steps = [
+            ("delete_table", "/api/v1/delete-table", table),
+            ("create_table", "/api/v1/create-table", table),
+            ("create_column", "/api/v1/create-column", dict(table, column_name="pokemon_number", column_type="integer")),
+            ("create_column", "/api/v1/create-column", dict(table, column_name="pokemon_name", column_type="text")),
+            ("create_column", "/api/v1/create-column", dict(table, column_name="notes", column_type="text")),
+            ("insert_row", "/api/v1/insert-row", dict(table, row_data={"pokemon_number": 1, "pokemon_name": "bulbasaur", "notes": "seed"})),
+            ("insert_rows", "/api/v1/insert-rows", dict(table, rows=[{"pokemon_number": i, "pokemon_name": f"row{i}", "notes": "seed"} for i in range(100)])),
+            ("import_rows", "/api/v1/import", csv),
+            ("get_columns", "/api/v1/columns", table),
+            ("get_rows (page)", "/api/v1/rows", dict(table, limit=50)),
+            ("select_row", "/api/v1/select-row", dict(table, column_name="pokemon_name", column_value="row", match="prefix")),
+            ("aggregate", "/api/v1/aggregate", dict(table, aggregates=[{"function": "count"}, {"function": "max", "column_name": "pokemon_number"}], group_by=["notes"])),
+            ("update_row", "/api/v1/update-row", dict(table, row_id=1, new_row_data={"notes": "updated"})),
+            ("update_rows", "/api/v1/update-rows", dict(table, where={"notes": "seed"}, new_row_data={"notes": "updated"})),
+            ("delete_row", "/api/v1/delete-row", dict(table, row_id=2)),
+            ("delete_rows", "/api/v1/delete-rows", dict(table, row_ids=[3, 4, 5])),
+            ("create_index", "/api/v1/create-index", dict(table, column_name="pokemon_name", index_type="btree")),
+            ("delete_index", "/api/v1/delete-index", dict(table, column_name="pokemon_name", index_type="btree")),
+            ("update_column_name", "/api/v1/update-column-name", dict(table, column_name="notes", new_column_name="comments")),
+            ("update_column_type", "/api/v1/update-column-type", dict(table, column_name="pokemon_number", new_column_type="bigint")),
+            ("delete_column", "/api/v1/delete-column", dict(table, column_name="comments")),
+            ("get_tables", "/api/v1/tables", None),
+            ("get_metrics", "/metrics", None),
+            ("delete_table", "/api/v1/delete-table", table),
+        ]
+
+        results = []
+        for route, path, data in steps:
+            if isinstance(data, str):
+                # The import body is the raw file, the arguments go in the query string
+                call = lambda: session.post(f"{self.url}{path}", headers=self.headers, params=dict(table, format="csv"), data=data)
+            elif data is None:
+                call = lambda: session.get(f"{self.url}{path}", headers=self.headers)
+            else:
+                call = lambda: self.post(session, path, data)
+            results.append(self.timed(route, call))
+        return results
+
+    def herd(self, session: requests.Session, state: dict) -> list:
+        if state["client"] == self.concurrency - 1:
+            return [self.timed("insert_row", lambda: self.post(session, "/api/v1/insert-row", {
+                "table_name": self.table, "row_data": {"pokemon_number": 0, "pokemon_name": "herd", "notes": "load test"}}))]
+        return [self.timed("get_rows (page)", lambda: self.post(session, "/api/v1/rows", {"table_name": self.table, "limit": self.page_size}))]
+
+    # *** Runner ***
+
+    def functionCalls(self) -> dict:
+        """
+        :return: {FlaskAPI function: calls that checked out a connection} from /metrics
+        """
+
+        calls = {}
+        for line in requests.get(f"{self.url}/metrics", timeout=5).text.splitlines():
+            if line.startswith('flaskapi_function_seconds_count{function="'):
+                name = line.split('"')[1]
+                calls[name] = int(float(line.rsplit(" ", 1)[1]))
+        return calls
+
+    def runScenario(self, name: str) -> dict:
+        """
+        :param name: Scenario method name
+        :return: {"requests", "errors", "seconds", "throughput", "rss_bytes", "db_calls": {function: calls},
+                  "routes": {route: {"count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms"}}}
+        """
+
+        step = getattr(self, name)
+        deadline = time.monotonic() + self.duration
+        results = []
+        lock = threading.Lock()
+        rss = {"start": processTreeRSS(self.server.pid), "peak": 0}
+        running = threading.Event()
+        running.set()
+
+        def sample():
+            while running.is_set():
+                rss["peak"] = max(rss["peak"], processTreeRSS(self.server.pid))
+                time.sleep(0.1)
+
+        def client(number: int):
+            state = {"client": number, "deadline": deadline}
+            with requests.Session() as session:
+                while time.monotonic() < deadline:
+                    step_results = step(session, state)
+                    with lock:
+                        results.extend(step_results)
+
+        callsBefore = self.functionCalls()
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        clients = [threading.Thread(target=client, args=(number,)) for number in range(self.concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        seconds = time.perf_counter() - start
+        running.clear()
+        sampler.join()
+        rss["end"] = processTreeRSS(self.server.pid)
+        callsAfter = self.functionCalls()
+
+        routes = {}
+        for route, latency, ok in results:
+            entry = routes.setdefault(route, {"latencies": [], "errors": 0})
+            entry["latencies"].append(latency)
+            entry["errors"] += 0 if ok else 1
+        summary = {}
+        for route, entry in sorted(routes.items()):
+            latencies = sorted(entry["latencies"])
+            summary[route] = {
+                "count": len(latencies),
+                "errors": entry["errors"],
+                "mean_ms": sum(latencies) / len(latencies) * 1000,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+
+        return {
+            "requests": len(results),
+            "errors": sum(entry["errors"] for entry in summary.values()),
+            "seconds": seconds,
+            "throughput": len(results) / seconds if seconds else 0.0,
+            "rss_bytes": rss,
+            "db_calls": {name: count - callsBefore.get(name, 0) for name, count in sorted(callsAfter.items()) if count > callsBefore.get(name, 0)},
+            "routes": summary,
+        }
+
+    def run(self, scenarios: list) -> dict:
+        if self.database is not None:
+            self.database.start()
+        try:
+            self.startApp()
+            self.seed()
+            results = {}
+            for name in scenarios:
+                results[name] = self.runScenario(name)
+                print(f"{name}: {results[name]['throughput']:.0f} req/s, {results[name]['errors']} errors")
+            return results
+        finally:
+            self.tearDown()
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def report(results: dict) -> None:
+    for name, scenario in results["scenarios"].items():
+        print(f"\n{name}: {scenario['requests']} requests in {scenario['seconds']:.1f}s, {scenario['throughput']:.0f} req/s, "
+              f"{scenario['errors']} errors, peak RSS {scenario['rss_bytes']['peak'] / 2 ** 20:.0f} MiB")
+        print(f"  {'route':<22}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for route, stats in scenario["routes"].items():
+            print(f"  {route:<22}{stats['count']:>8}{stats['errors']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+        if scenario.get("db_calls"):
+            print("  database calls: " + ", ".join(f"{name} {count}" for name, count in scenario["db_calls"].items()))
+
+
+def compare(results: dict, previous: dict) -> None:
+    """
+    Print the change in throughput and p95 latency against a previous run
+    """
+
+    print(f"\nCompared with {previous.get('commit', '')[:12]} ({previous.get('started', '')})")
+    for name, scenario in results["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        change = (scenario["throughput"] / before["throughput"] - 1) * 100 if before["throughput"] else 0.0
+        print(f"{name}: throughput {change:+.1f}%")
+        for route, stats in scenario["routes"].items():
+            old = before["routes"].get(route)
+            if old and old["p95_ms"]:
+                print(f"  {route:<22} p95 {old['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms ({(stats['p95_ms'] / old['p95_ms'] - 1) * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test every route of the API against a seeded Postgres")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows seeded in the read table")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per scenario")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per insert_rows request")
+    parser.add_argument("--page-size", type=int, default=1000, help="Rows per get_rows page")
+    parser.add_argument("--scenarios", default=",".join(benchmarkLoad.scenarios), help="Comma separated scenarios to run")
+    parser.add_argument("--external", action="store_true", help="Use the database of the POSTGRES_* variables instead of a throwaway one")
+    parser.add_argument("--output", default="load_test.json", help="JSON results file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    benchmark = benchmarkLoad(args.rows, args.concurrency, args.duration, args.batch_size, args.page_size, args.external)
+    started = datetime.now(timezone.utc).isoformat()
+    results = {
+        "started": started,
+        "commit": commit(),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": benchmark.run(args.scenarios.split(",")),
+    }
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    report(results)
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(results, json.load(previous))
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
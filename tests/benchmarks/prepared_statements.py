@@ -0,0 +1,65 @@
+import time
+import hashlib
+import os
+from modules.classes.FlaskAPI import FlaskAPI
+
+
+class benchmarkPreparedStatements:
+    """
+    Latency of repeated insert_row/select_row calls with and without prepared statements
+    Needs the POSTGRES_* environment variables of a database it may create and drop a table in
+
+    Run from the repository root: python -m tests.benchmarks.prepared_statements
+    """
+
+    def __init__(self, rows: int = 5000):
+        self.rows = rows
+        self.api_key = 'benchmark'
+        os.environ["API_KEY"] = hashlib.sha256(self.api_key.encode()).hexdigest()
+        self.api = FlaskAPI()
+        self.table = {"table_name": "benchmark_prepared_statements"}
+
+    def setUp(self):
+        self.api.delete_table(api_key=self.api_key, data=dict(self.table))
+        self.api.create_table(api_key=self.api_key, data=dict(self.table))
+        for column, column_type in [("pokemon_number", "integer"), ("pokemon_name", "text"), ("notes", "text")]:
+            self.api.create_column(api_key=self.api_key, data=dict(self.table, column_name=column, column_type=column_type))
+
+    def tearDown(self):
+        self.api.delete_table(api_key=self.api_key, data=dict(self.table))
+
+    def run(self, prepared: bool) -> tuple:
+        """
+        :param prepared: Use prepared statements
+        :return: (insert, select) microseconds per call
+        """
+
+        self.api.preparedStatements = prepared
+        start = time.perf_counter()
+        for i in range(self.rows):
+            self.api.insert_row(api_key=self.api_key, data=dict(self.table, row_data={"pokemon_number": i, "pokemon_name": f"Testing{i}", "notes": "benchmark"}))
+        insert = (time.perf_counter() - start) / self.rows * 1e6
+
+        start = time.perf_counter()
+        for i in range(self.rows):
+            self.api.select_row(api_key=self.api_key, data=dict(self.table, column_name="pokemon_name", column_value=f"Testing{i}", limit=1))
+        select = (time.perf_counter() - start) / self.rows * 1e6
+        return insert, select
+
+    def report(self):
+        self.setUp()
+        try:
+            for prepared in [False, True]:
+                insert, select = self.run(prepared)
+                print(f"prepared statements {'on ' if prepared else 'off'}: insert_row {insert:.0f} us/call, select_row {select:.0f} us/call")
+        finally:
+            self.tearDown()
+
+
+def main():
+    benchmark.report()
+
+
+if __name__ == '__main__':
+    benchmark = benchmarkPreparedStatements()
+    main()
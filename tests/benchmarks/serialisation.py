@@ -0,0 +1,138 @@
+import sys
+import json
+import time
+import hashlib
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class benchmarkSerialisation:
+    """
+    Python CPU time per 10k rows of a wide table for each way of building a get_rows response:
+    before: dict(zip(columns, row)) per row then the stdlib encoder, as Flask's default provider does
+    orjson: dict(zip(columns, row)) per row then orjson
+    passthrough: rows already serialised by json_agg, Python only wraps and encodes the text (DATABASE_JSON)
+
+    passthrough moves the encoding into Postgres, run with --database to also time selectRows end to end
+    (needs the POSTGRES_* environment variables of a database it may create and drop a table in)
+
+    Run from the repository root: python -m tests.benchmarks.serialisation [--database]
+    """
+
+    def __init__(self, rows: int = 10000, width: int = 20, repeat: int = 5):
+        self.rows = rows
+        self.repeat = repeat
+        self.columns = ["id"] + [f"column_{i}" for i in range(1, width)]
+        self.tuples = [tuple(self.value(row, column) for column in range(width)) for row in range(self.rows)]
+        self.aggregated = json.dumps([dict(zip(self.columns, row)) for row in self.tuples], separators=(",", ":"))
+
+    def value(self, row: int, column: int):
+        kind = column % 5
+        if column == 0:
+            return row + 1
+        if kind == 0:
+            return row * column
+        if kind == 1:
+            return f"pokemon {row} {column}"
+        if kind == 2:
+            return row / (column + 1)
+        if kind == 3:
+            return row % 2 == 0
+        return None if row % 3 else "notes"
+
+    def cpu(self, build) -> float:
+        """
+        :param build: Builds the response body
+        :return: Best CPU milliseconds per 10k rows over repeat runs
+        """
+
+        best = None
+        for _ in range(self.repeat):
+            start = time.process_time()
+            build()
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000 * 10000 / self.rows
+
+    def before(self) -> bytes:
+        rows = [dict(zip(self.columns, row)) for row in self.tuples]
+        return json.dumps({"data": rows, "next": None}, sort_keys=True, separators=(",", ":")).encode()
+
+    def withOrjson(self) -> bytes:
+        rows = [dict(zip(self.columns, row)) for row in self.tuples]
+        return orjson.dumps({"data": rows, "next": None}, option=orjson.OPT_SORT_KEYS)
+
+    def passthrough(self) -> bytes:
+        return ('{"data":' + self.aggregated + ',"next":null}').encode()
+
+    def report(self):
+        print(f"{self.rows} rows x {len(self.columns)} columns, CPU ms per 10k rows (best of {self.repeat})")
+        print(f"before (dict per row + stdlib json): {self.cpu(self.before):.1f}")
+        if orjson is not None:
+            print(f"orjson (dict per row + orjson): {self.cpu(self.withOrjson):.1f}")
+        else:
+            print("orjson: not installed")
+        print(f"passthrough (json_agg text, Python side only): {self.cpu(self.passthrough):.1f}")
+
+    def reportDatabase(self):
+        """
+        App process CPU and wall time of selectRows for a whole seeded table, with Postgres building the JSON or not
+        """
+
+        from flask import Flask
+        from modules.classes.FlaskAPI import FlaskAPI
+        from modules.classes.JSONProvider import createJSONProvider
+        from psycopg2 import sql
+
+        api_key = 'benchmark'
+        os.environ["API_KEY"] = hashlib.sha256(api_key.encode()).hexdigest()
+        app = Flask(__name__)
+        app.json = createJSONProvider(app)
+        api = FlaskAPI()
+        table = {"table_name": "benchmark_serialisation"}
+        api.delete_table(api_key=api_key, data=dict(table))
+        api.create_table(api_key=api_key, data=dict(table))
+        for column in self.columns[1:]:
+            api.create_column(api_key=api_key, data=dict(table, column_name=column, column_type="text"))
+
+        try:
+            with api.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    values = ", ".join(f"md5((i * {i})::text)" for i in range(1, len(self.columns)))
+                    cur.execute(f"INSERT INTO {table['table_name']} ({', '.join(self.columns[1:])}) "
+                                f"SELECT {values} FROM generate_series(1, %s) AS i", [self.rows])
+                conn.commit()
+
+            with app.app_context():
+                for databaseJSON in [False, True]:
+                    api.databaseJSON = databaseJSON
+                    best = None
+                    for _ in range(self.repeat):
+                        with api.pool.connection() as conn:
+                            api.local.conn, api.local.cur = conn, conn.cursor()
+                            cpu, wall = time.process_time(), time.perf_counter()
+                            result = api.selectRows(table["table_name"], self.columns, sql.SQL("TRUE"), [], {})
+                            body = result.get_data() if hasattr(result, "get_data") else app.json.response(result).get_data()
+                            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+                            api.local.cur.close()
+                            api.local.conn = api.local.cur = None
+                        best = (cpu, wall) if best is None or cpu < best[0] else best
+                    print(f"database json {'on ' if databaseJSON else 'off'}: app CPU {best[0] * 1000 * 10000 / self.rows:.1f} ms, "
+                          f"wall {best[1] * 1000 * 10000 / self.rows:.1f} ms per 10k rows ({len(body)} bytes)")
+        finally:
+            api.delete_table(api_key=api_key, data=dict(table))
+
+
+def main():
+    benchmark.report()
+    if "--database" in sys.argv:
+        benchmark.reportDatabase()
+
+
+if __name__ == '__main__':
+    benchmark = benchmarkSerialisation()
+    main()
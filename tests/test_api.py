@@ -81,22 +81,44 @@ class testFlaskAPI:
         response = requests.get('http://127.0.0.1:5000/api/v1/select-row', headers=self.headers, json=data)
         print(response.text)
 
-    def addPokemonToDatabase(self):
-        x = 0
+    def addPokemonToDatabase(self, batch_size: int = 500):
+        """
+        Loads pokemon.csv through /api/v1/insert-rows, batch_size rows per request
+
+        :param batch_size: Rows per request
+        :return:
+        """
+
         with open('pokemon.csv', 'r') as file:
             reader = csv.reader(file)
-            for row in reader:
-                if x == 0:
-                    x += 1
-                else:
-                    data = {"table_name": "pokemon_jhobbs",
-                            "row_data": {"pokemon_number": row[0].replace("'", '').replace("#", ''), "pokemon_name": row[1].replace("'", ''),
-                                         "pokemon_type": row[2].replace("'", "").replace("[", "")
-                                         .replace("]", ""), "notes": row[3]}}
-                    print(data)
-                    response = requests.post("http://127.0.0.1:5000/api/v1/insert-row", headers=self.headers, json=data)
-                    print(response.text)
-                    time.sleep(0.25)
+            next(reader)
+            rows = [{"pokemon_number": row[0].replace("'", '').replace("#", ''), "pokemon_name": row[1].replace("'", ''),
+                     "pokemon_type": row[2].replace("'", "").replace("[", "").replace("]", ""), "notes": row[3]}
+                    for row in reader]
+
+        start = time.perf_counter()
+        for i in range(0, len(rows), batch_size):
+            data = {"table_name": "pokemon_jhobbs", "rows": rows[i:i + batch_size]}
+            response = requests.post("http://127.0.0.1:5000/api/v1/insert-rows", headers=self.headers, json=data)
+            print(response.text)
+            # Stay under the 1/second rate limit
+            time.sleep(1)
+        elapsed = time.perf_counter() - start
+        print(f"{len(rows)} rows in {elapsed:.2f}s: {len(rows) / elapsed:.0f} rows/second")
+
+    def importPokemonCSV(self):
+        """
+        Streams pokemon.csv as is through /api/v1/import, the header row names the columns
+
+        :return:
+        """
+
+        start = time.perf_counter()
+        with open('pokemon.csv', 'rb') as file:
+            response = requests.post("http://127.0.0.1:5000/api/v1/import", params={"table_name": "pokemon_jhobbs", "format": "csv"},
+                                     headers={'Content-Type': 'text/csv'}, data=file)
+        print(response.text)
+        print(f"Imported in {time.perf_counter() - start:.2f}s")
 
 
 def main():
@@ -0,0 +1,23 @@
+import io
+from modules.classes.CopyReader import CopyReader
+
+
+def test_mixed_case_csv_header_matches_lower_case_columns():
+    reader = CopyReader(io.BytesIO(b"Name, Type\nBulbasaur,Grass\n"), "csv")
+
+    assert reader.columns == ["name", "type"]
+    assert reader.read() == "Bulbasaur,Grass\r\n"
+
+
+def test_columns_argument_is_stripped_and_lower_cased():
+    reader = CopyReader(io.BytesIO(b"Bulbasaur,Grass\n"), "csv", columns="Name, type".split(","), header=False)
+
+    assert reader.columns == ["name", "type"]
+
+
+def test_mixed_case_ndjson_keys_match_lower_case_columns():
+    reader = CopyReader(io.BytesIO(b'{"Name": "Bulbasaur", "TYPE": null}\n{"name": "Ivysaur", "type": ""}\n'), "ndjson")
+
+    assert reader.columns == ["name", "type"]
+    assert reader.read() == '"Bulbasaur",\r\n"Ivysaur",""\r\n'
+    assert reader.rejected == 0
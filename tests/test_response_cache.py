@@ -0,0 +1,36 @@
+import multiprocessing
+from modules.classes.ResponseCache import ResponseCache
+
+
+def write(uri: str, table_name: str) -> None:
+    """
+    A write handled by another worker process, see FlaskAPI.tableModified()
+    """
+
+    ResponseCache(storage_uri=uri).bump(table_name)
+
+
+def test_write_through_another_worker_invalidates_the_cache(tmp_path):
+    uri = f"sharedmem://{tmp_path / 'versions'}"
+    cache = ResponseCache(storage_uri=uri)
+    key = ("get_rows", '{"table_name": "pokemon"}')
+    cache.set(key, cache.version("pokemon"), b"[]")
+    assert cache.get(key, cache.version("pokemon")) is not None
+
+    worker = multiprocessing.get_context("fork").Process(target=write, args=(uri, "pokemon"))
+    worker.start()
+    worker.join()
+
+    assert worker.exitcode == 0
+    assert cache.get(key, cache.version("pokemon")) is None
+
+
+def test_write_to_another_table_keeps_the_cache(tmp_path):
+    uri = f"sharedmem://{tmp_path / 'versions'}"
+    cache = ResponseCache(storage_uri=uri)
+    key = ("get_rows", '{"table_name": "pokemon"}')
+    cache.set(key, cache.version("pokemon"), b"[]")
+
+    ResponseCache(storage_uri=uri).bump("trainers")
+
+    assert cache.get(key, cache.version("pokemon")).body == b"[]"